@@ -10,3 +10,8 @@ invalid_id = (
 proband_is_TEST = (
     """You have selected the proband ID "TEST". No data will be saved!"""
 )
+data_not_saved = (
+    "Some data could not be saved (%s failed attempts). Please make a note of the "
+    "proband ID and the tests that were run, and check that the disk is not full or "
+    "read-only. Details are in the log file, charlie.log."
+)
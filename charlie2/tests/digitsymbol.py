@@ -41,13 +41,13 @@ References
   814–823.
 
 """
+from functools import partial
 from logging import getLogger
 from typing import Dict, List
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QKeyEvent
-
-from charlie2.tools.stats import basic_summary
+from PyQt5.QtWidgets import QLabel
 
 from ..tools.basetestwidget import BaseTestWidget
 from ..tools.recipes import digits, symbols
@@ -67,9 +67,11 @@ class TestWidget(BaseTestWidget):
             1. Calls super() to initialise everything from base classes.
             2. Sets a block deadline of 90s (for practice, too).
             3. Hide the mouse.
-            4. Define x-positions of digits and symbols in the key.
-            5. Load and hide the key.
-            6. Set a flag so that skipped trials are deleted rather than stored.
+            4. Draw everything with the compositor.
+            5. Define x-positions of digits and symbols in the key.
+            6. Load and hide the key.
+            7. Set a flag so that skipped trials are deleted rather than stored.
+            8. Keep running summaries of each block.
 
         """
         super(TestWidget, self).__init__(parent)
@@ -78,12 +80,15 @@ class TestWidget(BaseTestWidget):
         else:
             self.block_deadline = 4 * 1000
         self.mouse_visible = False
+        self.compositing = True
         self.symbols = [self.load_image(f"sym{i}.png") for i in range(1, 10)]
         self.digits = [self.load_text(str(i)) for i in range(1, 10)]
         self.xs = range(-300, 350, 75)
         self.digit = None
         self.symbol = None
+        self.keys = []
         self.delete_skipped = True
+        self.summary_groups = {str(b): {"block_number": (b,)} for b in (1, 2)}
 
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
@@ -111,7 +116,8 @@ class TestWidget(BaseTestWidget):
 
         Does the following:
             1. Pre-load digits and symbols.
-            2. Displays block-specific task instructions with a key press to continue.
+            2. Pre-load the arrow keys and their labels.
+            3. Displays block-specific task instructions with a key press to continue.
 
         """
         for symbol, digit, x in zip(self.symbols, self.digits, self.xs):
@@ -120,6 +126,8 @@ class TestWidget(BaseTestWidget):
             digit.resize(g.size())
             self.move_widget(digit, (x, 200))
             digit.hide()
+        self.release(*self.keys)
+        self.keys = self.load_keyboard_arrow_keys(self.instructions[2:4])
         b = self.current_trial.block_number
         self.display_instructions_with_space_bar(self.instructions[4 + b])
 
@@ -134,8 +142,7 @@ class TestWidget(BaseTestWidget):
 
         """
         self.clear_screen(delete=False)
-        self.display_keyboard_arrow_keys(self.instructions[2:4])
-        [l.show() for l in self.symbols + self.digits]
+        [l.show() for l in self.keys + self.symbols + self.digits]
         s = self.current_trial.symbol
         d = self.current_trial.digit
         self.symbol = self.display_image(f"sym{s}.png", (0, 25))
@@ -145,7 +152,8 @@ class TestWidget(BaseTestWidget):
         """Key release event.
 
         If the event was a release of either the left or right arrow keys, records a
-        response. Displays feedback (if a practice trial) and moves onto the next trial.
+        response and marks the trial as completed. Displays feedback for 1 s (if a
+        practice trial) and moves onto the next trial.
 
         Args:
             event (PyQt5.QtGui.QKeyEvent)
@@ -158,17 +166,40 @@ class TestWidget(BaseTestWidget):
             t.rsp = dic[event.key()]
             t.correct = t.rsp == (t.symbol == t.digit)
             t.status = "completed"
-            self.symbol.deleteLater()
-            self.digit.deleteLater()
+            self._release_target()
             if t.practice:
                 self.performing_trial = False
                 s = self.instructions[7:9][not t.correct]
                 a = self.display_text(s, (0, -100))
                 self.play_feeback(t.correct)
-                self.sleep(1000)
-                a.hide()
-                a.deleteLater()
-                self._performing_trial = True
+                timeline = self.timeline("feedback", trial=True)
+                timeline.then(None, 1000, "feedback")
+                timeline.then(partial(self._end_feedback, a))
+                timeline.on_cancel(partial(self.release, a)).start()
+
+    def _trial_timeout(self) -> None:
+        """Remove the target digit and symbol, then skip the trial as usual.
+
+        Also called when the block times out during a trial. If this happens while
+        practice feedback is shown, the trial was already completed, so it is kept.
+
+        """
+        self._release_target()
+        if self.current_trial.status == "completed":
+            self._next_trial()
+        else:
+            super(TestWidget, self)._trial_timeout()
+
+    def _release_target(self) -> None:
+        """Remove the target digit and symbol from the compositor, if still there."""
+        if self.symbol is not None:
+            self.release(self.symbol, self.digit)
+            self.symbol = self.digit = None
+
+    def _end_feedback(self, label: QLabel) -> None:
+        """Remove the feedback and move onto the next trial."""
+        self.release(label)
+        self._next_trial()
 
     def summarise(self) -> Dict[str, int]:
         """Summarises the data.
@@ -181,10 +212,9 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = self.procedure.completed_trials
-        dic = basic_summary(trials)
+        running_summary = self.procedure.running_summary
+        dic = running_summary.summary()
         dic["adjusted_score"] = dic["correct_trials"] * dic["accuracy"]
-        for b in [1, 2]:
-            trials_ = [t for t in trials if t["block_number"] == b]
-            dic.update(basic_summary(trials_, prefix=str(b)))
+        for b in ("1", "2"):
+            dic.update(running_summary.summary(b))
         return dic
@@ -31,7 +31,6 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QKeyEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
-from charlie2.tools.stats import basic_summary
 
 __version__ = 2.0
 __author__ = "Sam Mathias"
@@ -48,6 +47,7 @@ class TestWidget(BaseTestWidget):
             1. Calls super() to initialise everything from base classes.
             2. Hides the mouse.
             3. Set the block deadline to 300 s.
+            4. Keep running summaries of each emotion.
 
         """
         super(TestWidget, self).__init__(parent)
@@ -56,6 +56,8 @@ class TestWidget(BaseTestWidget):
             self.block_deadline = 4 * 1000
         else:
             self.block_deadline = 240 * 1000
+        self.emotions = ("neutral", "sad", "angry")
+        self.summary_groups = {e: {"emotion": (e,)} for e in self.emotions}
 
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
@@ -113,16 +115,20 @@ class TestWidget(BaseTestWidget):
         """
         self.display_instructions_with_space_bar(self.instructions[4])
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Images needed by a trial, so they can be prefetched."""
+        return [trial["face"]]
+
     def trial(self) -> None:
         """New trial.
 
         Does the following:
-            1. Clears the screen (but doesn't delete).
+            1. Clears the screen, recycling the widgets from the last trial.
             2. Displays the face.
             3. Displays the arrow keys and their labels.
 
         """
-        self.clear_screen(delete=False)
+        self.clear_screen(delete=True)
         self.display_image(self.current_trial.face, (0, 100))
         self.display_keyboard_arrow_keys(self.instructions[5:8])
 
@@ -152,9 +158,8 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = self.procedure.completed_trials
-        dic = basic_summary(trials)
-        for emotion in ["neutral", "sad", "angry"]:
-            trials_ = [t for t in trials if t["emotion"] == emotion]
-            dic.update(basic_summary(trials_, prefix=emotion))
+        running_summary = self.procedure.running_summary
+        dic = running_summary.summary()
+        for emotion in self.emotions:
+            dic.update(running_summary.summary(emotion))
         return dic
@@ -34,7 +34,6 @@ from PyQt5.QtGui import QKeyEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
 
-from ..tools.stats import basic_summary
 
 __version__ = 2.0
 __author__ = "Sam Mathias"
@@ -51,11 +50,13 @@ class TestWidget(BaseTestWidget):
             1. Calls super() to initialise everything from base classes.
             2. Hides the mouse.
             3. Loads the keyboard arrow keys.
+            4. Keep a running summary of the recognition phase.
 
         """
         super(TestWidget, self).__init__(parent)
         self.mouse_visible = False
         self.keyboard_keys = self.load_keyboard_arrow_keys(self.instructions[2:4])
+        self.summary_groups = {"recognition": {"block_type": ("recognition",)}}
 
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
@@ -152,6 +153,10 @@ class TestWidget(BaseTestWidget):
                 self.block_deadline = 240 * 1000
         self.display_instructions_with_space_bar(self.instructions[4 + b])
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Images needed by a trial, so they can be prefetched."""
+        return [trial["face"]]
+
     def trial(self) -> None:
         """New trial.
 
@@ -193,9 +198,4 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = [
-            t
-            for t in self.procedure.completed_trials
-            if t["block_type"] == "recognition"
-        ]
-        return basic_summary(trials)
+        return self.procedure.running_summary.summary("recognition", prefix="")
@@ -34,7 +34,6 @@ from PyQt5.QtCore import QRect
 from PyQt5.QtGui import QMouseEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
-from charlie2.tools.stats import basic_summary
 
 __version__ = 2.0
 __author__ = "Sam Mathias"
@@ -44,6 +43,17 @@ logger = getLogger(__name__)
 
 
 class TestWidget(BaseTestWidget):
+    def __init__(self, parent=None) -> None:
+        """Initialise the test.
+
+        Does the following:
+            1. Calls super() to initialise everything from base classes.
+            2. Keep a window of the last five trials for the stopping rule.
+
+        """
+        super(TestWidget, self).__init__(parent)
+        self.index_window = 5
+
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
 
@@ -75,6 +85,10 @@ class TestWidget(BaseTestWidget):
         """
         self.display_instructions_with_continue_button(self.instructions[4])
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Images needed by a trial, so they can be prefetched."""
+        return [trial["matrix"], trial["array"]]
+
     def trial(self) -> None:
         """New trial.
 
@@ -83,7 +97,7 @@ class TestWidget(BaseTestWidget):
             2. Displays the matrix.
             3. Displays the array.
             4. Makes "zones" encapsulating array items.
-            5. Sleeps for 1 s to prevent super-quick responses.
+            5. Waits for 1 s before accepting responses to prevent super-quick ones.
 
         """
         self.clear_screen(delete=True)
@@ -103,8 +117,12 @@ class TestWidget(BaseTestWidget):
         # prevent super-quick responses
         if self.debugging is False:
             self.performing_trial = False
-            self.sleep(1000)
-            self.performing_trial = True
+            timeline = self.timeline("response delay", trial=True)
+            timeline.then(None, 1000, "delay").then(self._allow_responses).start()
+
+    def _allow_responses(self) -> None:
+        """Start accepting responses."""
+        self.performing_trial = True
 
     def mousePressEvent_(self, event: QMouseEvent) -> None:
         """Mouse or touchscreen press event.
@@ -131,20 +149,19 @@ class TestWidget(BaseTestWidget):
             bool: Should we stop?
 
         """
-        logger.debug(f"completed trials: {self.procedure.completed_trials}")
         n = len(self.procedure.completed_trials)
-        logger.debug(f"{n} trials completed")
+        logger.debug("%s trials completed", n)
         if n >= 5:
-            trials = self.procedure.completed_trials[-5:]
+            trials = self.procedure.trial_index.window
             correct = len([t for t in trials if t["correct"]])
-            logger.debug("correct trials: %s/5" % str(correct))
+            logger.debug("correct trials: %s/5", correct)
             if correct <= 1:
                 outcome = True
             else:
                 outcome = False
         else:
             outcome = False
-        logger.debug("should we stop? %s" % str(outcome))
+        logger.debug("should we stop? %s", outcome)
         return outcome
 
     def summarise(self) -> Dict[str, int]:
@@ -156,6 +173,6 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        dic = basic_summary(self.procedure.completed_trials)
+        dic = self.procedure.running_summary.summary()
         dic["accuracy"] = dic["correct_trials"] / 35
         return dic
@@ -32,7 +32,6 @@ from typing import Dict, List
 from PyQt5.QtGui import QMouseEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
-from charlie2.tools.stats import basic_summary
 
 __version__ = 2.0
 __author__ = "Sam Mathias"
@@ -48,6 +47,7 @@ class TestWidget(BaseTestWidget):
         Does the following:
             1. Calls super() to initialise everything from base classes.
             2. Sets a block deadline of 60s.
+            3. Draws the red square with the compositor.
 
         """
         super(TestWidget, self).__init__(parent)
@@ -55,6 +55,7 @@ class TestWidget(BaseTestWidget):
             self.block_deadline = 6 * 1000
         else:
             self.block_deadline = 60 * 1000
+        self.compositing = True
 
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
@@ -150,11 +151,11 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = self.procedure.completed_trials
-        dic = basic_summary(trials, adjust=True)
-        correct_trials = [t for t in trials if t["correct"] is True]
-        if len(correct_trials) > 0:
-            dic["total_attempts"] = sum(t["attempts"] for t in correct_trials)
-            denom = len(trials) + dic["total_attempts"]
-            dic["accuracy"] = len(correct_trials) / denom
+        running_summary = self.procedure.running_summary
+        dic = running_summary.summary(adjust=True)
+        g = running_summary.group()
+        if g["correct_all"] > 0:
+            dic["total_attempts"] = g["attempts"]
+            denom = g["n"] + dic["total_attempts"]
+            dic["accuracy"] = g["correct_all"] / denom
         return dic
@@ -40,9 +40,8 @@ References
 from logging import getLogger
 from typing import Dict, List
 
-from PyQt5.QtGui import QMouseEvent, QPainter, QPen
-
-from charlie2.tools.stats import basic_summary
+from PyQt5.QtCore import QRect, Qt
+from PyQt5.QtGui import QMouseEvent, QPainter, QPaintEvent, QPen, QPixmap
 
 from ..tools.basetestwidget import BaseTestWidget
 from ..tools.recipes import make_trail_trials
@@ -63,6 +62,9 @@ class TestWidget(BaseTestWidget):
             2. Sets a block deadline of 180 s.
             3. Defines rects and image storage lists.
             4. Defines a blank variable to store the tick.
+            5. Keep running summaries of each block type.
+            6. Prefetch the blazes of the whole of the next block.
+            7. Defines the pen and backing pixmap for drawing the trail.
 
         """
         super(TestWidget, self).__init__(parent)
@@ -73,6 +75,14 @@ class TestWidget(BaseTestWidget):
         self.rects = []
         self.images = []
         self.tick = None
+        self.block_types = ("number", "letter", "sequence")
+        self.summary_groups = {b: {"block_type": (b,)} for b in self.block_types}
+        self.prefetch_window = 20
+        self.pen = QPen()
+        self.pen.setWidth(4)
+        self.trail = None
+        self.trail_rect = QRect()
+        self.segments = 0
 
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
@@ -92,18 +102,26 @@ class TestWidget(BaseTestWidget):
         """
         return make_trail_trials()
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Images needed by a trial, so they can be prefetched."""
+        return [f"a_{trial['glyph']}.png"]
+
     def block(self) -> None:
         """New block.
 
         Does the following:
-            1. Displays the task instructions with a continue button.
-            2. Displays the blazes.
-            3. Makes "zones".
+            1. Recycles the blazes from the last block.
+            2. Displays the task instructions with a continue button.
+            3. Displays the blazes.
+            4. Makes "zones".
+            5. Clears the trail.
 
         In this test, individual blazes and their press events are considered "trials"
         and the whole visual array is considered a "block".
 
         """
+        if self.tick is not None:
+            self.release(*self.images, self.tick)
         b = self.current_trial.block_number
         self.display_instructions_with_continue_button(self.instructions[4 + b])
 
@@ -130,14 +148,19 @@ class TestWidget(BaseTestWidget):
         # make zones
         self.make_zones(self.rects)
 
+        # start a new trail
+        self.trail = None
+        self.update()
+
     def trial(self) -> None:
         """New trial.
 
         Does the following:
             1. Clears the screen.
             2. Displays the blazes.
-            3. Resets a list for recording time and position of attempts.
-            4. Resets "errors" and "attempts" counters.
+            3. Extends the trail to the last blaze pressed.
+            4. Resets a list for recording time and position of attempts.
+            5. Resets "errors" and "attempts" counters.
 
         """
         self.clear_screen(delete=False)
@@ -149,6 +172,9 @@ class TestWidget(BaseTestWidget):
         else:
             [img.show() for img in self.images]
 
+        # draw the new segment of the trail
+        self.update(self._extend_trail())
+
         # reset click/press counters
         t.attempts = 0
         t.errors = 0
@@ -183,22 +209,56 @@ class TestWidget(BaseTestWidget):
             logger.debug("clicked outside a blaze")
             t.attempts += 1
 
-    def paintEvent(self, _) -> None:
+    def _extend_trail(self) -> QRect:
+        """Draw any new segments of the trail onto the backing pixmap.
+
+        The trail joins the centres of the blazes already pressed in this block. Rather
+        than redrawing the whole trail on every repaint, segments are drawn once onto
+        an off-screen pixmap as they are completed, so each trial only draws its new
+        segment. The pixmap is recreated (and the trail redrawn) at the start of each
+        block and if the window changes size.
+
+        Returns:
+            QRect: Area of the window covered by the new segments.
+
+        """
+        dpr = self.devicePixelRatioF()
+        if self.trail is None or self.trail.size() != self.size() * dpr:
+            self.trail = QPixmap(self.size() * dpr)
+            self.trail.setDevicePixelRatio(dpr)
+            self.trail.fill(Qt.transparent)
+            self.segments = 0
+            self.trail_rect = QRect()
+        n = self.current_trial.trial_number if self.current_trial else 0
+        n = max(min(n, len(self.rects)) - 1, 0)
+        dirty = QRect()
+        if self.segments < n:
+            painter = QPainter(self.trail)
+            painter.setPen(self.pen)
+            rects = self.rects[self.segments : n + 1]
+            for a, b in zip(rects, rects[1:]):
+                painter.drawLine(a.center(), b.center())
+                dirty |= QRect(a.center(), b.center()).normalized()
+            painter.end()
+            w = self.pen.width()
+            dirty.adjust(-w, -w, w, w)
+            self.segments = n
+            self.trail_rect |= dirty
+        return dirty
+
+    def paintEvent(self, event: QPaintEvent) -> None:
         """Paint event.
 
-        Draws the trail between the blazes.
+        Copies the damaged part of the trail from the backing pixmap.
 
         """
-        t = self.current_trial
-        if t:
-            painter = QPainter(self)
-            pen = QPen()
-            pen.setWidth(4)
-            painter.setPen(pen)
-            rects = self.rects[: t.trial_number]
-            for a, b in zip([None] + rects, rects + [None]):
-                if a and b:
-                    painter.drawLine(a.center(), b.center())
+        if self.current_trial:
+            self._extend_trail()
+            rect = event.rect() & self.trail_rect
+            if not rect.isEmpty():
+                painter = QPainter(self)
+                painter.setClipRect(rect)
+                painter.drawPixmap(0, 0, self.trail)
 
     def summarise(self) -> Dict[str, int]:
         """Summarises the data.
@@ -211,17 +271,17 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = self.procedure.completed_trials
-        dic = {"total_time_taken": basic_summary(trials)["total_time_taken"]}
-        for b in ("number", "letter", "sequence"):
-            trials_ = [t for t in trials if t["block_type"] == b]
-            dic.update(basic_summary(trials_, adjust=True, prefix=b))
-            trials_ = [t for t in trials_ if t["correct"] is True]
-            if len(trials_) > 0:
-                a = sum(t["attempts"] for t in trials_)
+        running_summary = self.procedure.running_summary
+        dic = {"total_time_taken": running_summary.summary()["total_time_taken"]}
+        for b in self.block_types:
+            dic.update(running_summary.summary(b, adjust=True))
+            g = running_summary.group(b)
+            n = g["correct_all"]
+            if n > 0:
+                a = g["attempts"]
                 dic["_".join((b, "total_attempts"))] = a
-                b_ = sum(t["errors"] for t in trials_)
+                b_ = g["errors"]
                 dic["_".join((b, "total_errors"))] = b_
-                denom = len(trials_) + a + b_
-                dic["_".join((b, "accuracy"))] = len(trials_) / denom
+                denom = n + a + b_
+                dic["_".join((b, "accuracy"))] = n / denom
         return dic
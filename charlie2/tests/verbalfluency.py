@@ -43,7 +43,6 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtGui import QMouseEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
-from charlie2.tools.stats import basic_summary
 
 __version__ = 2.0
 __author__ = "Sam Mathias"
@@ -53,6 +52,22 @@ logging = getLogger(__name__)
 
 
 class TestWidget(BaseTestWidget):
+    def __init__(self, parent=None) -> None:
+        """Initialise the test.
+
+        Does the following:
+            1. Calls super() to initialise everything from base classes.
+            2. Keep running summaries of each kind of trial, and of all letter trials
+                together. Only "perform" trials are summarised.
+
+        """
+        super(TestWidget, self).__init__(parent)
+        perform = {"trial_type": ("perform",)}
+        self.kinds = {k: (k,) for k in ("f", "a", "s", "animal")}
+        self.kinds["letter"] = ("f", "a", "s")
+        self.summary_groups = {k: {**perform, "kind": v} for k, v in self.kinds.items()}
+        self.summary_groups[""] = perform
+
     def make_trials(self) -> List[Dict[str, int]]:
         """Generates new trials.
 
@@ -264,20 +279,14 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        trials = self.procedure.completed_trials
-        trials = [t for t in trials if t["trial_type"] == "perform"]
-        dic = {"total_time_taken": basic_summary(trials)["total_time_taken"]}
-        for k in ["f", "a", "s", "animal", "letter"]:
-            if k != "letter":
-                trials_ = [t for t in trials if t["kind"] == k]
-            else:
-                trials_ = [t for t in trials if t["kind"] in "fas"]
-            dic.update(basic_summary(trials_, prefix=k))
-            if len(trials_) > 0:
-                dic["_".join((k, "valid"))] = sum(t["valid_responses"] for t in trials_)
-                dic["_".join((k, "invalid"))] = sum(
-                    t["invalid_responses"] for t in trials_
-                )
+        running_summary = self.procedure.running_summary
+        dic = {"total_time_taken": running_summary.summary()["total_time_taken"]}
+        for k in self.kinds:
+            dic.update(running_summary.summary(k))
+            g = running_summary.group(k)
+            if g["n"] > 0:
+                dic["_".join((k, "valid"))] = g["valid_responses"]
+                dic["_".join((k, "invalid"))] = g["invalid_responses"]
         return dic
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
@@ -34,9 +34,6 @@ Reference
 from logging import getLogger
 
 from PyQt5.QtGui import QFont
-from PyQt5.QtMultimedia import QSound
-
-from charlie2.tools.stats import basic_summary
 
 from ..tools.basetestwidget import BaseTestWidget
 from ..tools.recipes import get_vwm_stimuli
@@ -49,6 +46,23 @@ logger = getLogger(__name__)
 
 
 class TestWidget(BaseTestWidget):
+    def __init__(self, parent=None) -> None:
+        """Initialise the test.
+
+        Does the following:
+            1. Calls super() to initialise everything from base classes.
+            2. Keep running summaries of each block type.
+            3. Index completed trials by block and length for the stopping rule.
+            4. Keep the sequence being played and the buttons it enables once done.
+
+        """
+        super(TestWidget, self).__init__(parent)
+        self.block_types = ("forward", "backward", "lns")
+        self.summary_groups = {b: {"block_type": (b,)} for b in self.block_types}
+        self.index_keys = [("block_number", "length")]
+        self.sequence = None
+        self.response_buttons = ()
+
     def make_trials(self):
 
         sequences = get_vwm_stimuli(self.kwds["language"])
@@ -138,14 +152,19 @@ class TestWidget(BaseTestWidget):
         incorr_button.clicked.disconnect()
         incorr_button.clicked.connect(self._incorrect)
 
-        sound = QSound(self.aud_stim_paths[f"{str(t.sequence)}.wav"])
+        # play the sequence, and enable the buttons once it has finished
         corr_button.setEnabled(False)
         incorr_button.setEnabled(False)
-        sound.play()
-        while not sound.isFinished():
-            self.sleep(100)
-        corr_button.setEnabled(True)
-        incorr_button.setEnabled(True)
+        self.response_buttons = (corr_button, incorr_button)
+        self.sequence = self.play_sound(f"{str(t.sequence)}.wav", self._allow_responses)
+
+    def _allow_responses(self) -> None:
+        """Record when the sequence started playing and enable the response buttons."""
+        t = self.current_trial
+        t.sound_onset_ns = self.sequence.onset_ns
+        t.sound_latency_ms = self.sequence.latency_ms
+        for button in self.response_buttons:
+            button.setEnabled(True)
 
     def _correct(self):
 
@@ -155,7 +174,7 @@ class TestWidget(BaseTestWidget):
             t.status = "completed"
             self._add_timing_details()
             logger.debug("current_trial was completed successfully")
-            logger.debug("(final version) of current_trial looks like %s" % str(t))
+            logger.debug("(final version) of current_trial looks like %s", t)
             self.next_trial()
 
     def _incorrect(self):
@@ -166,7 +185,7 @@ class TestWidget(BaseTestWidget):
             t.status = "completed"
             self._add_timing_details()
             logger.debug("current_trial was completed successfully")
-            logger.debug("(final version) of current_trial looks like %s" % str(t))
+            logger.debug("(final version) of current_trial looks like %s", t)
             self.next_trial()
 
     def mousePressEvent(self, event):
@@ -174,17 +193,16 @@ class TestWidget(BaseTestWidget):
         pass
 
     def summarise(self):
-        trials = self.procedure.completed_trials
-        dic = {"total_time_taken": basic_summary(trials)["total_time_taken"]}
-        for b in ("forward", "backward", "lns"):
-            trials_ = [t for t in trials if t["block_type"] == b]
-            dic.update(basic_summary(trials_, prefix=b))
+        running_summary = self.procedure.running_summary
+        dic = {"total_time_taken": running_summary.summary()["total_time_taken"]}
+        for b in self.block_types:
+            dic.update(running_summary.summary(b))
         return dic
 
     def block_stopping_rule(self):
 
         last_trial = self.procedure.completed_trials[-1]
-        logger.debug("applying stopping rule to this trial: %s" % str(last_trial))
+        logger.debug("applying stopping rule to this trial: %s", last_trial)
         if last_trial["practice"]:
             logger.debug("practice trial, so don't apply stopping rule")
             return False
@@ -194,14 +212,15 @@ class TestWidget(BaseTestWidget):
         else:
             logger.debug("fwd or bwd trial, 2 trials per length")
             n = 2
-        ct = self.procedure.completed_trials
-        trials = [t for t in ct if t["block_number"] == last_trial["block_number"]]
-        trials = [t for t in trials if t["length"] == last_trial["length"]]
-        logger.debug("%s trials to evaluate: %s" % (len(trials), trials))
+        trials = self.procedure.trial_index.lookup(
+            ("block_number", "length"),
+            (last_trial["block_number"], last_trial["length"]),
+        )
+        logger.debug("%s trials to evaluate: %s", len(trials), trials)
         if len(trials) < n:
             logger.debug("too few trials")
             return False
         errs = [t for t in trials if t["correct"] is False]
-        logger.debug(logger.debug("%s error trials: %s" % (len(errs), errs)))
-        logger.debug("number of errors: %s" % len(errs))
+        logger.debug("%s error trials: %s", len(errs), errs)
+        logger.debug("number of errors: %s", len(errs))
         return True if len(errs) == n else False
@@ -32,10 +32,9 @@ from math import cos, pi, sin
 from sys import gettrace
 from typing import Dict, List
 
-from PyQt5.QtGui import QMouseEvent, QPixmap
+from PyQt5.QtGui import QMouseEvent
 
 from charlie2.tools.basetestwidget import BaseTestWidget
-from charlie2.tools.stats import basic_summary
 
 __version__ = 1.0
 __author__ = "Sam Mathias"
@@ -114,27 +113,44 @@ class TestWidget(BaseTestWidget):
         """
         self.display_instructions_with_continue_button(self.instructions[4])
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Images needed by a trial, so they can be prefetched."""
+        n = trial["trial_number"]
+        names = ["l%i_t%i_i%i.png" % (4, n, i) for i in range(4)]
+        return names + ["l%i_t%i_i%i_r.png" % (4, n, 0)]
+
     def trial(self) -> None:
         """New trial.
 
         Does the following:
             1. Hides the mouse and disables responses.
-            2. Clears the screen.
-            3. Displays the study array.
-            4. Hide the study array
+            2. Clears the screen, recycling the widgets from the last trial.
+            3. Displays the study array for 3 s.
+            4. Hide the study array for 2 s.
             5. Show the response array.
             6. Set up "zones".
 
-        """
-
-        t = self.current_trial
+        The phases are run by a timeline, so this method returns immediately.
 
+        """
         logger.debug("commencing study phase of trial")
         self.mouse_visible = False
         self.performing_trial = False
-        self.clear_screen(delete=False)
-
+        self.clear_screen(delete=True)
+        if self.debugging is False:  # checks whether running through a debugger
+            study, retention = 3000, 2000
+        else:
+            study, retention = 0, 0
+        timeline = self.timeline("visualmemory", trial=True)
+        timeline.then(self._study, study, "study")
+        timeline.then(self._retention, retention, "retention")
+        timeline.then(self._respond, 0, "respond")
+        timeline.start()
+
+    def _study(self) -> None:
+        """Display the study array."""
         logger.debug("about to display items")
+        t = self.current_trial
         self.labels = []
         delta = 2 * pi / 4
         for item in range(4):
@@ -144,20 +160,22 @@ class TestWidget(BaseTestWidget):
             s = "l%i_t%i_i%i.png" % (4, t.trial_number, item)
             label = self.display_image(s, (x, y))
             self.labels.append(label)
-        if self.debugging is False:  # checks whether running through a debugger
-            self.sleep(3000)
 
+    def _retention(self) -> None:
+        """Hide the study array."""
         [label.hide() for label in self.labels]
-        if self.debugging is False:
-            self.sleep(2000)
 
+    def _respond(self) -> None:
+        """Show the response array and start accepting responses."""
+        t = self.current_trial
         s = "l%i_t%i_i%i_r.png" % (4, t.trial_number, 0)
-        self.labels[0].setPixmap(QPixmap(self.vis_stim_paths[s]))
+        self.labels[0].setPixmap(self.load_pixmap(s))
         [label.show() for label in self.labels]
 
         self.make_zones([l.frameGeometry() for l in self.labels])
         self.mouse_visible = True
         self.performing_trial = True
+        self.frames.start_trial()
 
     def mousePressEvent_(self, event: QMouseEvent) -> None:
         """Mouse or touchscreen press event.
@@ -184,13 +202,10 @@ class TestWidget(BaseTestWidget):
             bool: Should we stop?
 
         """
-        trials = self.procedure.completed_trials
-        logger.debug(str(trials))
-        if len(trials) > 4:
-            correct = [t for t in trials if t["correct"]]
-            logger.debug(str(correct))
-            logger.debug(str(len(correct) / len(trials)))
-            return True if len(correct) / len(trials) <= .25 else False
+        g = self.procedure.running_summary.group()
+        if g["n"] > 4:
+            logger.debug("accuracy so far: %s", g["correct_all"] / g["n"])
+            return True if g["correct_all"] / g["n"] <= .25 else False
         else:
             return False
 
@@ -203,6 +218,6 @@ class TestWidget(BaseTestWidget):
             dict: Summary statistics.
 
         """
-        dic = basic_summary(self.procedure.completed_trials)
+        dic = self.procedure.running_summary.summary()
         dic["k"] = dic["accuracy"] * 4
         return dic
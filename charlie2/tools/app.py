@@ -4,11 +4,13 @@
 from logging import getLogger
 from sys import argv, exit
 
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication
 
 from .mainwindow import MainWindow
 from .paths import logo_path
+from .startup import report_startup
 
 logger = getLogger(__name__)
 
@@ -20,4 +22,5 @@ def run_app() -> None:
     app.setWindowIcon(QIcon(logo_path))
     app.setStyle("Fusion")
     ex = MainWindow()
+    QTimer.singleShot(0, report_startup)
     exit(app.exec_())
@@ -0,0 +1,212 @@
+"""Defines stimulus atlases: the decoded images of a test packed into one file.
+
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from logging import getLogger
+from mmap import ACCESS_READ, mmap
+from os import listdir as ls
+from os import replace, stat
+from os.path import exists
+from os.path import join as pj
+from struct import Struct
+from sys import byteorder
+from typing import Dict, List, Union
+
+from PyQt5.QtGui import QImage
+
+from .paths import _get_vis_stim_paths, vis_stim_path
+
+logger = getLogger(__name__)
+_header = Struct("<4sI")
+_magic = b"CHA1"
+_align = 16
+_format = QImage.Format_ARGB32_Premultiplied
+_atlases = {}
+atlas_name = "stimuli.atlas"
+
+
+def _base(n: int) -> int:
+    """Returns the offset of the pixels in an atlas whose index is `n` bytes long."""
+    return _header.size + n + -(_header.size + n) % _align
+
+
+class Atlas(object):
+    def __init__(self, path: str) -> None:
+        """Stimulus atlas.
+
+        Decoding PNGs is the main cost of loading visual stimuli, and opening dozens of
+        small files is slow on SD cards. An atlas holds all the images of one test,
+        already decoded into premultiplied ARGB32 pixels (the format pixmaps use
+        internally), in a single file built by `build_atlas`. The file starts with a
+        header and an index giving the offset, width, height, and bytes per line of
+        each image, followed by the pixels themselves. Offsets are counted from the
+        start of the pixels, which is aligned to 16 bytes. The index also records the
+        size and modification time of every source .png file, so that an atlas which
+        is out of date can be detected.
+
+        The file is memory-mapped rather than read, and the operating system is asked
+        to read it ahead sequentially. `image` wraps a slice of the map in a `QImage`
+        without copying or decoding anything.
+
+        Args:
+            path (str): Path to the atlas file.
+
+        """
+        logger.debug("initialised %s with path=%s", type(self), path)
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap(f.fileno(), 0, access=ACCESS_READ)
+        if hasattr(self._map, "madvise"):
+            from mmap import MADV_SEQUENTIAL, MADV_WILLNEED
+
+            self._map.madvise(MADV_SEQUENTIAL)
+            self._map.madvise(MADV_WILLNEED)
+        magic, n = _header.unpack_from(self._map)
+        if magic != _magic:
+            raise ValueError(f"{path} is not a stimulus atlas")
+        index = loads(self._map[_header.size : _header.size + n].decode())
+        if index["byteorder"] != byteorder:
+            raise ValueError(f"{path} was built on a machine with different byte order")
+        self.index = index["images"]
+        self.sources = index.get("sources")
+        self._view = memoryview(self._map)[_base(n) :]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def image(self, name: str) -> QImage:
+        """Returns an image from the atlas.
+
+        The image shares its pixels with the memory map, so it is only valid while the
+        atlas is open. Pass it to `QPixmap.fromImage` or call `copy` to keep it.
+
+        Args:
+            name (str): Name of the original .png file.
+
+        Returns:
+            QImage: The image.
+
+        """
+        offset, width, height, bpl = self.index[name]
+        pixels = self._view[offset : offset + height * bpl]
+        return QImage(pixels, width, height, bpl, _format)
+
+    def is_stale(self, s: str) -> bool:
+        """Returns True if the stimuli of test `s` have changed since the atlas was
+        built. Atlases built before sources were recorded are always stale.
+
+        """
+        return self.sources != _source_stamps(s)
+
+
+def atlas_path(s: str) -> str:
+    """Returns the path to the atlas of test `s`."""
+    return pj(vis_stim_path, s, atlas_name)
+
+
+def _source_stamps(s: str) -> Dict[str, List[int]]:
+    """Returns the size and mtime (in ns) of each visual stimulus file of test `s`."""
+    stamps = {}
+    for name, png in _get_vis_stim_paths(s).items():
+        st = stat(png)
+        stamps[name] = [st.st_size, st.st_mtime_ns]
+    return stamps
+
+
+def build_atlas(s: str) -> str:
+    """Pack the visual stimuli of test `s` into an atlas.
+
+    The atlas must be rebuilt whenever the stimuli change; until then it is ignored and
+    the images are loaded from the .png files.
+
+    Args:
+        s (str): Test name, or "common".
+
+    Returns:
+        str: Path to the atlas.
+
+    """
+    path = atlas_path(s)
+    logger.info("building atlas %s", path)
+    images = {}
+    blobs = []
+    sources = _source_stamps(s)
+    for name, png in sorted(_get_vis_stim_paths(s).items()):
+        image = QImage(png).convertToFormat(_format)
+        if image.isNull():
+            logger.warning("could not decode image %s", png)
+            continue
+        images[name] = [0, image.width(), image.height(), image.bytesPerLine()]
+        blobs.append(image.constBits().asstring(image.bytesPerLine() * image.height()))
+    offset = 0
+    for entry, blob in zip(images.values(), blobs):
+        entry[0] = offset
+        offset += len(blob) + -len(blob) % _align
+    index = {"byteorder": byteorder, "images": images, "sources": sources}
+    index = dumps(index).encode()
+    with open(path + ".tmp", "wb") as f:
+        f.write(_header.pack(_magic, len(index)))
+        f.write(index)
+        for entry, blob in zip(images.values(), blobs):
+            f.write(b"\0" * (_base(len(index)) + entry[0] - f.tell()))
+            f.write(blob)
+    replace(path + ".tmp", path)
+    return path
+
+
+def get_atlas(s: str) -> Union[Atlas, None]:
+    """Returns the atlas of test `s`, or None if it has not been built.
+
+    Atlases are opened once and stay open for the lifetime of the app. An atlas whose
+    stimuli have changed since it was built is ignored.
+
+    Args:
+        s (str): Test name, or "common".
+
+    """
+    if s not in _atlases:
+        path = atlas_path(s)
+        atlas = None
+        if exists(path):
+            try:
+                atlas = Atlas(path)
+            except (OSError, ValueError) as e:
+                logger.warning("could not open atlas %s: %s", path, e)
+            if atlas is not None and atlas.is_stale(s):
+                logger.warning("atlas %s is out of date, so not using it", path)
+                atlas = None
+        _atlases[s] = atlas
+    return _atlases[s]
+
+
+def get_vis_stim_atlases(s: str) -> Dict[str, Atlas]:
+    """Returns a dictionary whose keys are the file names of visual stimuli for test
+    `s` and values are the atlases containing them. This mirrors `get_vis_stim_paths`;
+    stimuli not found in any atlas are omitted.
+
+    Args:
+        s: Test name.
+
+    Returns:
+        dict: Dictionary of atlases.
+
+    """
+    dic = {}
+    for t in ("common", s):
+        atlas = get_atlas(t)
+        if atlas is not None:
+            dic.update({n: atlas for n in atlas.index})
+    return dic
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Pack visual stimuli into atlases.")
+    parser.add_argument(
+        "tests", nargs="*", help="Tests to pack (default: all stimulus folders)."
+    )
+    args = parser.parse_args()
+    for t in args.tests or sorted(ls(vis_stim_path)):
+        if _get_vis_stim_paths(t):
+            print(build_atlas(t))
@@ -0,0 +1,188 @@
+"""Defines a bank of preloaded sounds shared by every test widget.
+
+"""
+from collections import Counter
+from logging import getLogger
+from typing import Callable, Dict, Iterable, Union
+from wave import open as open_wave
+
+from PyQt5.QtCore import QObject, QTimer, QUrl, pyqtSignal
+from PyQt5.QtMultimedia import QSoundEffect
+
+from .timing import Clock, get_clock
+
+logger = getLogger(__name__)
+_audio_bank = None
+finish_margin_ms = 2000
+
+
+class Sound(QObject):
+
+    started = pyqtSignal()
+    finished = pyqtSignal()
+
+    def __init__(self, path: str, clock: Clock) -> None:
+        """A preloaded sound.
+
+        `QSound` opens and decodes its .wav file every time it is played, and offers no
+        way to find out when playback has finished other than polling `isFinished`. A
+        sound wraps a `QSoundEffect`, which decodes the file once into memory (on a
+        background thread, as soon as the sound is created) and keeps an audio stream
+        open, so playback starts with low latency. `started` and `finished` are emitted
+        when playback starts and stops; a callback may also be passed to `play`.
+
+        The start latency of each playback is the time from `play` being called to the
+        effect starting to play. This includes any wait for the file to finish loading,
+        but not delays within the audio backend, which cannot be observed.
+
+        If the file cannot be loaded or played (for example, if there is no audio
+        device), the effect never starts, so a watchdog timer makes sure the callback is
+        still called: immediately if loading has already failed, otherwise once the
+        duration of the file plus `finish_margin_ms` has passed without playback ending.
+
+        Sounds mimic the parts of the `QSound` interface used by tests (`play`, `stop`,
+        and `isFinished`).
+
+        Args:
+            path (str): Path to the .wav file.
+            clock (Clock): Clock from which to take times.
+
+        """
+        super(Sound, self).__init__()
+        self.path = path
+        self.clock = clock
+        self.requested_ns = None
+        self.onset_ns = None
+        self.latency_ms = None
+        self._then = None
+        self.duration_ms = self._duration_ms(path)
+        self._watchdog = QTimer(self)
+        self._watchdog.setSingleShot(True)
+        self._watchdog.timeout.connect(self._timed_out)
+        self.effect = QSoundEffect(self)
+        self.effect.playingChanged.connect(self._playing_changed)
+        self.effect.statusChanged.connect(self._status_changed)
+        self.effect.setSource(QUrl.fromLocalFile(path))
+
+    @staticmethod
+    def _duration_ms(path: str) -> int:
+        try:
+            with open_wave(path) as f:
+                return int(f.getnframes() / f.getframerate() * 1000)
+        except Exception as e:
+            logger.warning("could not read the duration of %s: %s", path, e)
+            return 0
+
+    def play(self, then: Callable = None) -> None:
+        """Start playing the sound from the beginning.
+
+        Args:
+            then (:obj:`callable`, optional): Called with no arguments once this
+                playback has finished, unless the sound is stopped first.
+
+        """
+        self._then = None
+        if self.effect.isPlaying():
+            self.effect.stop()
+        self._then = then
+        self.requested_ns = self.clock.now_ns()
+        self.onset_ns = None
+        self.latency_ms = None
+        if self.effect.status() == QSoundEffect.Error:
+            self._watchdog.start(0)
+            return
+        self._watchdog.start(self.duration_ms + finish_margin_ms)
+        self.effect.play()
+
+    def stop(self) -> None:
+        """Stop playing the sound without calling the callback passed to `play`."""
+        self._then = None
+        self._watchdog.stop()
+        self.effect.stop()
+
+    def isFinished(self) -> bool:
+        return not self.effect.isPlaying()
+
+    def _playing_changed(self) -> None:
+        if self.effect.isPlaying():
+            if self.requested_ns is not None and self.onset_ns is None:
+                self.onset_ns = self.clock.now_ns()
+                self.latency_ms = (self.onset_ns - self.requested_ns) / 1e6
+                logger.debug("%s started after %.3f ms", self.path, self.latency_ms)
+            self.started.emit()
+        else:
+            self._watchdog.stop()
+            then, self._then = self._then, None
+            self.finished.emit()
+            if then is not None:
+                then()
+
+    def _status_changed(self) -> None:
+        if self.effect.status() == QSoundEffect.Error:
+            logger.warning("could not load %s", self.path)
+            if self._watchdog.isActive():
+                self._watchdog.start(0)
+
+    def _timed_out(self) -> None:
+        if self.effect.status() == QSoundEffect.Error:
+            logger.warning("%s could not be played, carrying on without it", self.path)
+        else:
+            logger.warning("%s did not finish playing in time", self.path)
+        then, self._then = self._then, None
+        playing = self.effect.isPlaying()
+        self.effect.stop()
+        if not playing:
+            self.finished.emit()
+        if then is not None:
+            then()
+
+
+class AudioBank(object):
+    def __init__(self, clock: Clock = None) -> None:
+        """Bank of preloaded sounds.
+
+        Sounds are created the first time they are needed (or when `load` is called)
+        and then shared by every test widget for the lifetime of the app, so each .wav
+        file is only decoded once. The start latency of every playback is counted in a
+        histogram of whole milliseconds.
+
+        Args:
+            clock (:obj:`Clock`, optional): Clock from which to take times.
+
+        """
+        logger.debug("initialised %s", type(self))
+        self.clock = get_clock() if clock is None else clock
+        self.sounds: Dict[str, Sound] = {}
+        self.histogram = Counter()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.sounds
+
+    def load(self, paths: Iterable[str]) -> None:
+        """Start loading these sounds, if they have not been loaded already."""
+        for path in paths:
+            self.sound(path)
+
+    def sound(self, path: str) -> Sound:
+        """Returns the sound for a .wav file, loading it if necessary."""
+        if path not in self.sounds:
+            sound = Sound(path, self.clock)
+            sound.started.connect(lambda: self._count(sound))
+            self.sounds[path] = sound
+        return self.sounds[path]
+
+    def _count(self, sound: Sound) -> None:
+        if sound.latency_ms is not None:
+            self.histogram[int(sound.latency_ms)] += 1
+
+    def stats(self) -> Dict[str, Union[int, dict]]:
+        """Returns the number of sounds loaded and the latency histogram."""
+        return {"sounds": len(self.sounds), "latency_ms": dict(self.histogram)}
+
+
+def get_audio_bank() -> AudioBank:
+    """Returns the audio bank shared by the whole app."""
+    global _audio_bank
+    if _audio_bank is None:
+        _audio_bank = AudioBank()
+    return _audio_bank
@@ -1,10 +1,11 @@
 """Defines a Qt widget containing convenience methods for playing sounds.
 
 """
+from collections import Counter
 from logging import getLogger
+from typing import Callable
 
-from PyQt5.QtMultimedia import QSound
-
+from .audiobank import Sound, get_audio_bank
 from .debugging import DebuggingWidget
 from .paths import get_aud_stim_paths
 
@@ -31,25 +32,69 @@ class AudioWidget(DebuggingWidget):
             "resumable",
         )
         self.kwds = {k: v for k, v in self.parent().kwds.items() if k in inherit}
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # stimuli paths
         self.aud_stim_paths = get_aud_stim_paths(self.kwds["test_name"])
 
+        # preload every sound this test could play
+        self.audio = get_audio_bank()
+        self.audio.load(self.aud_stim_paths.values())
+        self._sounds_with_callbacks = set()
+        self._audio_histogram = Counter(self.audio.histogram)
+
         # silence
-        self.silence = QSound(self.aud_stim_paths["silence.wav"])
+        self.silence = self.sound("silence.wav")
 
         # 440 pip
-        self.pip = QSound(self.aud_stim_paths["440.wav"])
+        self.pip = self.sound("440.wav")
 
         # feedback
-        self.correct = QSound(self.aud_stim_paths["correct.wav"])
-        self.incorrect = QSound(self.aud_stim_paths["incorrect.wav"])
+        self.correct = self.sound("correct.wav")
+        self.incorrect = self.sound("incorrect.wav")
         self.feedback_sounds = [self.incorrect, self.correct]
 
         # other sounds
-        self.test_over = QSound(self.aud_stim_paths["test_over.wav"])
-        self.new_block = QSound(self.aud_stim_paths["new_block.wav"])
+        self.test_over = self.sound("test_over.wav")
+        self.new_block = self.sound("new_block.wav")
+
+    def sound(self, s: str) -> Sound:
+        """Returns the preloaded sound for the .wav file `s`."""
+        return self.audio.sound(self.aud_stim_paths[s])
+
+    def play_sound(self, s: str, then: Callable = None) -> Sound:
+        """Play the .wav file `s`.
+
+        Args:
+            s (str): Name of the .wav file.
+            then (:obj:`callable`, optional): Called with no arguments once the sound
+                has finished playing. Not called if `stop_sounds` is called first.
+
+        Returns:
+            Sound: The sound, whose `latency_ms` is set once it starts playing.
+
+        """
+        logger.debug("called play_sound() with s=%s", s)
+        sound = self.sound(s)
+        if then is not None:
+            self._sounds_with_callbacks.add(sound)
+        sound.play(then)
+        return sound
+
+    def stop_sounds(self) -> None:
+        """Stop sounds played with callbacks, so the callbacks are never called."""
+        for sound in self._sounds_with_callbacks:
+            sound.stop()
+        self._sounds_with_callbacks.clear()
+
+    def audio_latency_histogram(self) -> Counter:
+        """Returns the start latencies (in whole ms) of sounds played by this widget.
+
+        The audio bank counts every playback in the app, so this is the difference
+        between its histogram now and when the widget was created.
+
+        """
+        return self.audio.histogram - self._audio_histogram
 
     def play_feeback(self, correct):
         """Play either the correct or incorrect sound."""
@@ -59,12 +104,9 @@ class AudioWidget(DebuggingWidget):
         else:
             sound.play()
 
-    def play_pip(self, sleep):
-        """Play a regular pip but optionally sleep while its playing."""
+    def play_pip(self, then: Callable = None) -> None:
+        """Play a regular pip, and optionally call `then` once it has finished."""
         if not self.pip.isFinished():
             pass
         else:
-            self.pip.play()
-            if sleep:
-                while not self.pip.isFinished():
-                    self.sleep(10)
+            self.play_sound("440.wav", then)
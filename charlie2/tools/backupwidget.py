@@ -4,14 +4,15 @@
 from logging import getLogger
 from pickle import load
 
-from httplib2 import ServerNotFoundError
-from PyQt5.QtCore import QEventLoop, QTimer
 from PyQt5.QtWidgets import QLabel, QPushButton, QVBoxLayout, QWidget
 
-from charlie2.tools.googledrive import backup
+from charlie2.tools.lazy import LazyModule
 from charlie2.tools.paths import last_backed_up
+from charlie2.tools.scheduler import Timeline
 
 logger = getLogger(__name__)
+googledrive = LazyModule("charlie2.tools.googledrive")
+httplib2 = LazyModule("httplib2")
 
 
 class BackupWidget(QWidget):
@@ -22,7 +23,7 @@ class BackupWidget(QWidget):
         pushed."""
         # TODO: Currently uploading overwrites identical files previously uploaded.
         super(BackupWidget, self).__init__(parent=parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # instructions
         self.instructions = self.parent().instructions
@@ -52,15 +53,24 @@ class BackupWidget(QWidget):
             return "Never!"
 
     def _attempt_backup(self) -> None:
-        """Try to back up."""
+        """Try to back up.
+
+        Waits 1 s before attempting to back up, so that the message within the button
+        is visible. The wait is run by a timeline, so this method returns immediately.
+
+        """
         logger.debug("called _attempt_backup()")
         self.button.setEnabled(False)
-        success = False
         self.button.setText(self.instructions[54])
-        self._sleep(1000)
+        self._timeline = Timeline("backup")
+        self._timeline.then(None, 1000, "message").then(self._backup).start()
+
+    def _backup(self) -> None:
+        """Back up and show whether it worked."""
+        success = False
         try:
-            success = backup()
-        except ServerNotFoundError:
+            success = googledrive.backup()
+        except httplib2.ServerNotFoundError:
             pass
         if success:
             self.label.setText(self.instructions[52] % self._last_backed_up)
@@ -68,13 +78,3 @@ class BackupWidget(QWidget):
         else:
             self.button.setText(self.instructions[56])
         self.button.setEnabled(True)
-
-    @staticmethod
-    def _sleep(t) -> None:
-        """Used to pause for 1 s before attempting to back up. Allows the message within
-        the button to be visible.
-
-        """
-        loop = QEventLoop()
-        QTimer.singleShot(t, loop.quit)
-        loop.exec_()
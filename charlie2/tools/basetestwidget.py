@@ -1,13 +1,18 @@
 """Defines a Qt widget which serves as the blueprint for tests.
 
 """
+from collections import Counter
 from logging import getLogger
+from typing import List
 
-from PyQt5.QtCore import QEventLoop, Qt, QTime, QTimer
-from PyQt5.QtGui import QKeyEvent, QMouseEvent
+from PyQt5.QtCore import Qt, QTime, QTimer
+from PyQt5.QtGui import QInputEvent, QKeyEvent, QMouseEvent
 
+from .persistence import get_worker
+from .pixmapcache import get_pixmap_cache
+from .prefetch import get_prefetcher
 from .procedure import SimpleProcedure
-from .stats import basic_summary
+from .tracing import get_tracer, traced
 from .visualwidget import VisualWidget
 
 logger = getLogger(__name__)
@@ -23,7 +28,7 @@ class BaseTestWidget(VisualWidget):
 
         """
         super(BaseTestWidget, self).__init__(parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # timers
         self.block_time = QTime()
@@ -34,6 +39,10 @@ class BaseTestWidget(VisualWidget):
         self.trial_timer = QTimer()
         self.trial_timer.setSingleShot(True)
         self.trial_timer.timeout.connect(self._trial_timeout)
+        self.clock = self.frames.clock
+        self.stimulus_ready_ns = None
+        self.event_ns = None
+        self.handled_ns = None
 
         # override these if necessary
         self.silent_block = False
@@ -43,6 +52,10 @@ class BaseTestWidget(VisualWidget):
         self.procedure = None
         self.current_trial = None
         self.delete_skipped = False
+        self.summary_groups = {}
+        self.index_keys = []
+        self.index_window = 0
+        self.prefetch_window = 3
 
         # silent attributes
         self._performing_block = False
@@ -72,7 +85,7 @@ class BaseTestWidget(VisualWidget):
             logger.debug("starting the block time")
             time.start()
         if value is True and deadline:
-            logger.debug("block deadline: %s" % str(self.block_deadline))
+            logger.debug("block deadline: %s", self.block_deadline)
             logger.debug("starting one-shot block timer")
             timer.start(deadline)
 
@@ -101,8 +114,11 @@ class BaseTestWidget(VisualWidget):
             logger.debug("performing_trial set to True")
             logger.debug("starting the trial time")
             time.start()
+            self.stimulus_ready_ns = self.clock.now_ns()
+            self.event_ns = None
+            self.handled_ns = None
         if value is True and deadline:
-            logger.debug("trial deadline: %s" % str(self.trial_deadline))
+            logger.debug("trial deadline: %s", self.trial_deadline)
             logger.debug("starting one-shot trial timer")
             timer.start(deadline)
 
@@ -153,24 +169,51 @@ class BaseTestWidget(VisualWidget):
     def begin(self) -> None:
         """Start the test.
 
-        Public method called by the parent widget. Starts by initialising a procedure
-        (currently only SimpleProcedure implemented), creates a new trial list if
-        needed, and steps into the test.
+        Public method called by the parent widget. Prepares the test, unless the parent
+        has already done so, and steps into the test.
 
         """
         logger.debug("called begin()")
+        if self.procedure is None:
+            self.prepare()
+        self._step()
+
+    def prepare(self) -> None:
+        """Prepare the test without starting it.
+
+        Initialises a procedure (currently only SimpleProcedure implemented) and
+        creates a new trial list if needed (see `make_procedure`).
+
+        """
+        logger.debug("called prepare()")
+        self.procedure = self.make_procedure()
+
+    def make_procedure(self) -> SimpleProcedure:
+        """Returns a new procedure for this test, with a trial list if needed.
+
+        Loading the procedure's data and generating trials do not touch the widget,
+        and nothing is saved until the test starts (see `SimpleProcedure`), so in a
+        batch the parent calls this on a background thread while the previous test is
+        still running, and then sets `procedure` itself.
+
+        """
+        logger.debug("called make_procedure()")
         if self.delete_skipped is True:
             self.kwds["delete_skipped"] = True
-        self.procedure = SimpleProcedure(**self.kwds)
-        started = self.procedure.data["test_started"]
-        completed = self.procedure.data["test_completed"]
+        self.kwds["summary_groups"] = self.summary_groups
+        self.kwds["index_keys"] = self.index_keys
+        self.kwds["index_window"] = self.index_window
+        procedure = SimpleProcedure(**self.kwds)
+        started = procedure.data["test_started"]
+        completed = procedure.data["test_completed"]
         if started is False and completed is False:
             logger.debug("generating new remaining_trials list")
-            self.procedure.data["remaining_trials"] = self.make_trials()
-            self.procedure.update()
-            logger.debug(f"looks like {self.procedure.data['remaining_trials']}")
-        self._step()
+            procedure.data["remaining_trials"] = self.make_trials()
+            procedure.update()
+            logger.debug("looks like %s", procedure.data["remaining_trials"])
+        return procedure
 
+    @traced()
     def _step(self) -> None:
         """Step forward in the test.
 
@@ -180,10 +223,14 @@ class BaseTestWidget(VisualWidget):
         """
         logger.debug("called _step()")
         self.performing_trial = False
+        self.cancel_timelines(trial_only=True)
+        self.stop_sounds()
 
         try:
             self.current_trial = self.procedure.next(self.current_trial)
-            logger.debug(f"successfully iterated, got this: {self.current_trial}")
+            logger.debug("successfully iterated, got this: %s", self.current_trial)
+            self._log_live_stats()
+            self._prefetch()
 
             if self.current_trial.first_trial_in_block:
                 logger.debug("first trial in new block")
@@ -201,6 +248,44 @@ class BaseTestWidget(VisualWidget):
             logger.info("failed to iterate, end of test")
             self.safe_close()
 
+    @traced()
+    def _prefetch(self) -> None:
+        """Start decoding the images of the current trial and the next few trials.
+
+        The number of upcoming trials to look at is given by `prefetch_window`.
+        Images which are already cached, or which are in an atlas and so need no
+        decoding, are skipped. Sounds are skipped too, because every sound the test
+        could play is already preloaded by the audio bank.
+
+        """
+        upcoming = self.procedure.remaining_trials[: self.prefetch_window]
+        cache = get_pixmap_cache()
+        paths = []
+        for trial in [self.current_trial] + upcoming:
+            for s in self.stimuli(trial):
+                if s.endswith(".wav") or s in self.vis_stim_atlases:
+                    continue
+                elif (self.vis_stim_paths[s], None) not in cache:
+                    paths.append(self.vis_stim_paths[s])
+        get_prefetcher().schedule(paths)
+
+    def _log_live_stats(self) -> None:
+        """Log running performance figures for the experimenter.
+
+        These are not shown on screen, because the proband could see them.
+
+        """
+        live = self.procedure.running_summary.live()
+        figures = [f"{live['trials']} trials"]
+        if live["accuracy"] is not None:
+            figures.append(f"{live['accuracy']:.0%} correct")
+        if live["mean_rt_ms"] is not None:
+            figures.append(f"RT {live['mean_rt_ms']:.0f} ms")
+        if live["sd_rt_ms"] is not None:
+            figures[-1] += f" (SD {live['sd_rt_ms']:.0f})"
+        name = self.procedure.test_name
+        logger.debug("live stats for %s: %s", name, ", ".join(figures))
+
     def _stop_block(self) -> None:
         """Stop the current block because stopping rule passed."""
         logger.debug("called _block_stop")
@@ -220,6 +305,7 @@ class BaseTestWidget(VisualWidget):
         logger.debug("called _block_stopping_rule()")
         return False if self.current_trial is None else self.block_stopping_rule()
 
+    @traced()
     def _block(self) -> None:
         """Runs at the start of a new block of trials.
 
@@ -229,6 +315,11 @@ class BaseTestWidget(VisualWidget):
         """
         logger.debug("called _block()")
         self.performing_block = False
+        b = self.current_trial.block_number
+        self.procedure.start_block(b)
+        if all(t.get("block_number", 0) == b for t in self.procedure.remaining_trials):
+            logger.debug("this is the final block, so preparing the next test")
+            self.parent().prepare_next_test()
         logger.debug("checking if this is a silent block")
 
         if self.silent_block:
@@ -244,6 +335,7 @@ class BaseTestWidget(VisualWidget):
             logger.debug("running block()")
             self.block()
 
+    @traced()
     def _trial(self) -> None:
         """Runs at the start of a new trial.
 
@@ -255,25 +347,62 @@ class BaseTestWidget(VisualWidget):
         self.silence.play()
         if self.current_trial.first_trial_in_block and not self.skip_countdown:
             logger.debug("countdown requested")
-            self.display_countdown()
+            self.display_countdown(then=self._start_trial)
+        else:
+            self._start_trial()
+
+    @traced()
+    def _start_trial(self) -> None:
+        """Start the trial proper, after the countdown if there was one."""
+        logger.debug("called _start_trial()")
         self.repaint()
         if self.current_trial.first_trial_in_block is True:
             logger.debug("this is the first trial in a new block")
             self.performing_block = True
         self.performing_trial = True
+        self.frames.start_trial()
         self.trial()
 
     def block_stopping_rule(self) -> bool:
         """Override this method."""
         return False
 
+    def stimuli(self, trial: dict) -> List[str]:
+        """Override this method.
+
+        Returns the file names of the stimuli needed by `trial`, so their images can be
+        prefetched. Trials may be plain dictionaries rather than `Trial` objects.
+
+        """
+        return []
+
     def make_trials(self) -> None:
-        """Override this method."""
+        """Override this method.
+
+        May be called on a background thread (see `make_procedure`), so must not
+        create or change any widgets.
+
+        """
         raise AssertionError("make_trials must be overridden")
 
+    @traced()
     def safe_close(self) -> None:
         """Safely clean up and save the data."""
         logger.debug("called safe_close()")
+        self.cancel_timelines()
+        self.stop_sounds()
+
+        # add this session's display latencies to the histogram
+        histogram = self.procedure.data["display_latency_ms_histogram"]
+        histogram = dict(self.frames.histogram + Counter(histogram))
+        self.procedure.data["display_latency_ms_histogram"] = histogram
+        logger.debug("display latency histogram (ms: frames): %s", histogram)
+
+        # likewise for audio start latencies
+        histogram = self.procedure.data["audio_latency_ms_histogram"]
+        histogram = dict(self.audio_latency_histogram() + Counter(histogram))
+        self.procedure.data["audio_latency_ms_histogram"] = histogram
+        logger.debug("audio latency histogram (ms: playbacks): %s", histogram)
 
         # properly ended test
         if self.procedure.data["test_completed"] is True:
@@ -288,6 +417,19 @@ class BaseTestWidget(VisualWidget):
             rt = [t for t in self.procedure.data["remaining_trials"]]
             self.procedure.data["remaining_trials"] = [dict(self.current_trial)] + rt
             self.procedure.save()
+            self.procedure.close()
+
+        logger.debug("pixmap cache: %s", get_pixmap_cache().stats())
+        logger.debug("prefetcher: %s", get_prefetcher().stats())
+        logger.debug("widget pool: %s", self.pool_stats)
+
+        # wait for the data to reach the disk
+        logger.debug("waiting for the persistence worker")
+        get_worker().flush()
+        self.parent().check_saved()
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.flush()
 
         # end test
         logger.debug("all done, so switching the central widget")
@@ -316,33 +458,64 @@ class BaseTestWidget(VisualWidget):
         logger.debug("called next_trial()")
         self._next_trial()
 
+    @traced()
     def mousePressEvent(self, event: QMouseEvent) -> None:
         """Overridden from `QtWidget`.
 
         Args:
             event (PyQt5.QtGui.QMouseEvent):
         """
-        logger.debug(f"called mousePressEvent() with event={event}")
+        logger.debug("called mousePressEvent() with event=%s", event)
         if self.performing_trial:
+            self._stamp_event(event)
             self.mousePressEvent_(event)
             self._add_timing_details()
-            if self.current_trial.status == "completed":
+            # tests which show feedback stop performing and move on by themselves
+            if self.performing_trial and self.current_trial.status == "completed":
                 logger.debug("current_trial was completed successfully")
                 self._next_trial()
 
+    @traced()
     def keyReleaseEvent(self, event: QKeyEvent) -> None:
         """Overridden from `QtWidget`."""
-        logger.debug(f"called keyReleaseEvent() with event={event}")
+        logger.debug("called keyReleaseEvent() with event=%s", event)
         if self.performing_trial:
+            self._stamp_event(event)
             self.keyReleaseEvent_(event)
             self._add_timing_details()
-            if self.current_trial.status == "completed":
+            # tests which show feedback stop performing and move on by themselves
+            if self.performing_trial and self.current_trial.status == "completed":
                 logger.debug("current_trial was completed successfully")
                 self._next_trial()
 
+    def _stamp_event(self, event: QInputEvent) -> None:
+        """Record when an input event was handled and, if known, generated."""
+        self.handled_ns = self.clock.now_ns()
+        self.event_ns = self.clock.event_ns(event, self.handled_ns)
+
     def _add_timing_details(self) -> None:
-        """Gathers some details about the current state from the various timers."""
+        """Gathers some details about the current state from the various timers.
+
+        Besides the millisecond timers, records three nanosecond times from `clock`:
+        when the trial started (`stimulus_ready_ns`), when the trial's last input event
+        was generated (`event_ns`, None if unknown), and when it was handled
+        (`handled_ns`, None if there was no input event, e.g., after a timeout). From
+        these, `rt_ms` is the sub-millisecond response time, measured up to when the
+        event was generated if known, and `input_latency_ms` is the delay between the
+        event being generated and handled.
+
+        Also records when the trial's stimuli were first flushed to the screen
+        (`onset_ns`, see `FrameMonitor`), how long after the trial started this
+        happened (`onset_latency_ms`), and the response time measured from then
+        (`rt_from_onset_ms`). These are None if no frame was painted before the
+        response.
+
+        """
         logger.debug("called _add_timing_details()")
+        ready, event, handled = self.stimulus_ready_ns, self.event_ns, self.handled_ns
+        responded = handled if event is None else event
+        onset = self.frames.trial_onset_ns
+        rt_onset = None if None in (onset, responded) else responded - onset
         dic = {
             "block_time_elapsed_ms": self.block_time.elapsed(),
             "trial_time_elapsed_ms": self.trial_time.elapsed(),
@@ -350,6 +523,14 @@ class BaseTestWidget(VisualWidget):
             "trial_time_left_ms": self._time_left_in_trial,
             "block_time_up_ms": self._block_time_up,
             "trial_time_up_ms": self._trial_time_up,
+            "stimulus_ready_ns": ready,
+            "event_ns": event,
+            "handled_ns": handled,
+            "rt_ms": None if None in (ready, responded) else (responded - ready) / 1e6,
+            "input_latency_ms": None if event is None else (handled - event) / 1e6,
+            "onset_ns": onset,
+            "onset_latency_ms": self.frames.trial_latency_ms,
+            "rt_from_onset_ms": None if rt_onset is None else rt_onset / 1e6,
         }
         self.current_trial.update(dic)
 
@@ -362,8 +543,14 @@ class BaseTestWidget(VisualWidget):
         raise AssertionError("trial must be overridden")
 
     def summarise(self) -> dict:
-        """This method can be overridden."""
-        return basic_summary(self.procedure.data["completed_trials"])
+        """This method can be overridden.
+
+        Summary statistics are taken from the procedure's running summary, which is
+        kept up to date as trials are completed, so no trials need to be rescanned
+        here. Groups of trials to summarise separately are given by `summary_groups`.
+
+        """
+        return self.procedure.running_summary.summary()
 
     def mousePressEvent_(self, event: QMouseEvent) -> None:
         """Override this method."""
@@ -372,21 +559,3 @@ class BaseTestWidget(VisualWidget):
     def keyReleaseEvent_(self, event: QKeyEvent) -> None:
         """Override this method."""
         pass
-
-    def sleep(self, t: int) -> None:
-        """Sleep for `t` ms.
-
-        Use instead of `time.sleep()` or any other method of sleeping because (a) Qt
-        handles it properly and (b) it prevents a `closeEvent` from quitting the test
-        during this time.
-
-        Args:
-            t (int): Time to sleep in seconds.
-
-        """
-        logger.debug(f"called sleep with t={t}")
-        self.parent().ignore_close_event = True
-        loop = QEventLoop()
-        QTimer.singleShot(t, loop.quit)
-        loop.exec_()
-        self.parent().ignore_close_event = False
@@ -0,0 +1,221 @@
+"""Defines a compositor which draws stimuli onto a widget in a single paint event.
+
+"""
+from logging import getLogger
+from typing import List, Union
+
+from PyQt5.QtCore import QPoint, QRect, QSize, Qt
+from PyQt5.QtGui import QFont, QFontMetrics, QPainter, QPaintEvent, QPen, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+logger = getLogger(__name__)
+
+
+class Sprite(object):
+    def __init__(self, compositor: "Compositor") -> None:
+        """An image or piece of text in a compositor's display list.
+
+        Sprites stand in for the `QLabel` objects returned by `VisualWidget.load_image`
+        and `VisualWidget.load_text`, and support the subset of the `QLabel` interface
+        used by tests: showing, hiding, moving, and resizing them, getting their
+        geometry, and changing their pixmap, text, font, or alignment. Every change
+        marks only the area of the widget covered by the sprite (before and after the
+        change) as needing to be repainted.
+
+        Args:
+            compositor (Compositor): The compositor which draws this sprite.
+
+        """
+        self.compositor = compositor
+        self._rect = QRect(0, 0, 100, 30)
+        self._visible = False
+        self._pixmap = None
+        self._text = ""
+        self._font = QFont(compositor.widget.font())
+        self._alignment = Qt.AlignLeft | Qt.AlignVCenter
+
+    def _damage(self) -> None:
+        if self._visible:
+            self.compositor.damage(self._rect)
+
+    def draw(self, painter: QPainter) -> None:
+        """Draw the sprite."""
+        if self._pixmap is not None:
+            painter.drawPixmap(self._rect.topLeft(), self._pixmap)
+        if self._text:
+            painter.setFont(self._font)
+            painter.drawText(self._rect, self._alignment, self._text)
+
+    def rect(self) -> QRect:
+        """Area covered by the sprite."""
+        return self._rect
+
+    def show(self) -> None:
+        self._visible = True
+        self._damage()
+
+    def hide(self) -> None:
+        self._damage()
+        self._visible = False
+
+    def isVisible(self) -> bool:
+        return self._visible
+
+    def frameGeometry(self) -> QRect:
+        return QRect(self._rect)
+
+    geometry = frameGeometry
+
+    def size(self) -> QSize:
+        return self._rect.size()
+
+    def move(self, *pos: Union[QPoint, int]) -> None:
+        self._damage()
+        self._rect.moveTopLeft(pos[0] if len(pos) == 1 else QPoint(*pos))
+        self._damage()
+
+    def resize(self, *size: Union[QSize, int]) -> None:
+        self._damage()
+        self._rect.setSize(size[0] if len(size) == 1 else QSize(*size))
+        self._damage()
+
+    def sizeHint(self) -> QSize:
+        if self._pixmap is not None:
+            return self._pixmap.size()
+        metrics = QFontMetrics(self._font)
+        return metrics.boundingRect(QRect(), self._alignment, self._text).size()
+
+    def pixmap(self) -> Union[QPixmap, None]:
+        return self._pixmap
+
+    def setPixmap(self, pixmap: QPixmap) -> None:
+        self._pixmap = pixmap
+        self._text = ""
+        self._damage()
+
+    def text(self) -> str:
+        return self._text
+
+    def setText(self, text: str) -> None:
+        self._text = text
+        self._pixmap = None
+        self._damage()
+
+    def setFont(self, font: QFont) -> None:
+        self._font = QFont(font)
+        self._damage()
+
+    def setAlignment(self, alignment: Qt.Alignment) -> None:
+        self._alignment = alignment
+        self._damage()
+
+    def property(self, _) -> None:
+        """Sprites never belong to the widget pool."""
+        return None
+
+    def deleteLater(self) -> None:
+        """Remove the sprite from the display list."""
+        self.hide()
+        self.compositor.remove(self)
+
+
+class Line(Sprite):
+    def __init__(self, compositor: "Compositor", a: QPoint, b: QPoint, pen: QPen):
+        """A line segment in a compositor's display list.
+
+        Args:
+            compositor (Compositor): The compositor which draws this line.
+            a (QPoint): Start of the line.
+            b (QPoint): End of the line.
+            pen (QPen): Pen with which to draw the line.
+
+        """
+        super(Line, self).__init__(compositor)
+        self.a = QPoint(a)
+        self.b = QPoint(b)
+        self.pen = QPen(pen)
+        w = pen.width() // 2 + 1
+        self._rect = QRect(self.a, self.b).normalized().adjusted(-w, -w, w, w)
+
+    def draw(self, painter: QPainter) -> None:
+        """Draw the line."""
+        painter.save()
+        painter.setPen(self.pen)
+        painter.drawLine(self.a, self.b)
+        painter.restore()
+
+
+class Compositor(object):
+    def __init__(self, widget: QWidget) -> None:
+        """Retained-mode renderer for stimuli.
+
+        Normally each stimulus is a child `QLabel` of the test widget. Showing, hiding,
+        and moving dozens of child widgets each trial is relatively slow, because each
+        widget is painted separately and every change may trigger a repaint of its
+        parent. Instead, a compositor keeps a display list of sprites (images and text)
+        and lines, and draws all of them onto the widget itself in its `paintEvent`.
+        Only items intersecting the area being repainted are drawn; sprites mark the
+        areas they cover as damaged when they change, so Qt merges these into one
+        repaint of just those areas.
+
+        Items are drawn in the order they were added, so later items appear on top.
+
+        Args:
+            widget (QWidget): The widget to draw onto.
+
+        """
+        logger.debug("initialised %s with widget=%s", type(self), widget)
+        self.widget = widget
+        self.items: List[Sprite] = []
+
+    def sprite(self) -> Sprite:
+        """Add a new, hidden sprite to the display list."""
+        sprite = Sprite(self)
+        self.items.append(sprite)
+        return sprite
+
+    def line(self, a: QPoint, b: QPoint, pen: QPen = None) -> Line:
+        """Add a new, hidden line to the display list."""
+        if pen is None:
+            pen = QPen()
+            pen.setWidth(4)
+        line = Line(self, a, b, pen)
+        self.items.append(line)
+        return line
+
+    def remove(self, item: Sprite) -> None:
+        """Remove an item from the display list."""
+        try:
+            self.items.remove(item)
+        except ValueError:
+            pass  # already removed
+
+    def hide_all(self) -> None:
+        """Hide every item."""
+        for item in self.items:
+            item.hide()
+
+    def clear(self) -> None:
+        """Hide and remove every item."""
+        self.hide_all()
+        self.items = []
+
+    def damage(self, rect: QRect) -> None:
+        """Mark an area of the widget as needing to be repainted."""
+        self.widget.update(rect)
+
+    def paint(self, event: QPaintEvent, painter: QPainter = None) -> None:
+        """Draw the visible items which intersect the area being repainted.
+
+        Args:
+            event (QPaintEvent): The widget's paint event.
+            painter (:obj:`QPainter`, optional): An active painter on the widget.
+                Created if not given.
+
+        """
+        if painter is None:
+            painter = QPainter(self.widget)
+        region = event.region()
+        for item in self.items:
+            if item.isVisible() and region.intersects(item.rect()):
+                item.draw(painter)
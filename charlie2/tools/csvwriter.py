@@ -0,0 +1,122 @@
+"""Defines a streaming csv writer for trials.
+
+"""
+from csv import writer
+from logging import getLogger
+from os import linesep
+from typing import Iterable, List
+
+from .lazy import LazyModule
+
+logger = getLogger(__name__)
+pd = LazyModule("pandas")
+
+
+class TrialWriter(object):
+    def __init__(self, path: str, trials: Iterable[dict] = ()) -> None:
+        """Streaming trial writer.
+
+        Keeps the csv file open and appends one row per completed trial, so the cost of
+        recording a trial does not depend on how many trials came before it.
+
+        Trials from the same test usually contain the same keys, but new keys sometimes
+        appear part-way through (e.g., `rsp` is only added once a response is made).
+        When this happens the header evolves: new columns are appended to the right of
+        the existing ones and the file is rewritten once from the rows held in memory.
+        Since the number of distinct keys is small and fixed, these rewrites are rare
+        and their cost is amortised over the whole test.
+
+        Column order follows order of first appearance, as in `pandas.DataFrame`. The
+        streamed file is not guaranteed to be byte-for-byte identical to the output of
+        `pandas.DataFrame.to_csv` (pandas infers dtypes from whole columns), so `close`
+        writes the canonical version once the test is over.
+
+        Args:
+            path (str): Path to the csv file.
+            trials (:obj:`iterable` of :obj:`dict`, optional): Trials already completed,
+                e.g., when resuming a test.
+
+        """
+        logger.debug("initialised %s with path=%s", type(self), path)
+        self.path = path
+        self.rows = []
+        self.columns = []
+        self._keys = set()
+        self._file = None
+        self._writer = None
+        for trial in trials:
+            self.rows.append(trial)
+            self._add_columns(trial)
+
+    def _add_columns(self, trial: dict) -> bool:
+        """Update the header, returning True if it changed."""
+        new = [k for k in trial if k not in self._keys]
+        self.columns += new
+        self._keys.update(new)
+        return len(new) > 0
+
+    def _row(self, trial: dict) -> List[object]:
+        """Format a trial as a list of values in column order."""
+        return ["" if trial.get(k) is None else trial[k] for k in self.columns]
+
+    def _rewrite(self) -> None:
+        """Write the header and all rows from scratch, leaving the file open."""
+        logger.debug("rewriting %s with %s columns", self.path, len(self.columns))
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "w", newline="")
+        self._writer = writer(self._file, lineterminator=linesep)
+        self._writer.writerow(self.columns)
+        self._writer.writerows(self._row(t) for t in self.rows)
+        self._file.flush()
+
+    def append(self, trial: dict) -> None:
+        """Append a single completed trial.
+
+        Args:
+            trial (dict): The completed trial.
+
+        """
+        self.extend([trial])
+
+    def extend(self, trials: List[dict]) -> None:
+        """Append several completed trials at once.
+
+        Args:
+            trials (:obj:`list` of :obj:`dict`): The completed trials.
+
+        """
+        changed = False
+        for trial in trials:
+            self.rows.append(trial)
+            changed = self._add_columns(trial) or changed
+        if changed or self._file is None:
+            self._rewrite()
+        else:
+            self._writer.writerows(self._row(t) for t in trials)
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the file and replace it with the canonical version.
+
+        Nothing is written if there are no trials.
+
+        """
+        logger.debug("closing %s", self.path)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+        if len(self.rows) > 0:
+            write_csv(self.path, self.rows)
+
+
+def write_csv(path: str, trials: List[dict]) -> None:
+    """Write all trials to a csv in one go.
+
+    Args:
+        path (str): Path to the csv file.
+        trials (:obj:`list` of :obj:`dict`): Trials to write.
+
+    """
+    pd.DataFrame(trials).dropna(axis=1, how="all").to_csv(path, index=False)
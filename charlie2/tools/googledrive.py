@@ -67,10 +67,10 @@ def _exists(service: object, name: object, parents: object) -> object:
     [logger.debug(name + "<->" + i["name"]) for i in items]
     items = [i for i in items if i["name"] == name]
     if len(items) == 0:
-        logger.debug(f"no item with name {name} with parents {parents} found")
+        logger.debug("no item with name %s with parents %s found", name, parents)
         return None
     elif len(items) == 1:
-        logger.debug(f"item with name {name} with parents {parents} found")
+        logger.debug("item with name %s with parents %s found", name, parents)
         return items[0]
     else:
         raise IndexError("More than one item found")
@@ -90,11 +90,11 @@ def _create_folder(service: object, name: object, parents: object) -> object:
     logger.debug("called _create_folder()")
     item = _exists(service, name, parents)
     if item is None:
-        logger.debug(f"creating a folder called {name} with parents {parents}")
+        logger.debug("creating a folder called %s with parents %s", name, parents)
         metadata = {"name": name, "parents": parents, "mimeType": mime % "folder"}
         item = service.files().create(body=metadata, fields="id").execute()
     else:
-        logger.debug(f"not creating the folder")
+        logger.debug("not creating the folder")
     return item
 
 
@@ -114,15 +114,15 @@ def _upload_file(service: object, name: object, parents: object, path: object) -
     media = MediaFileUpload(path, mimetype=mimetype)
     item = _exists(service, name, parents)
     if item is None:
-        logger.debug(f"uploading file")
+        logger.debug("uploading file")
         service.files().create(body=metadata, media_body=media, fields="id").execute()
     else:
         fid = item["id"]
         if update_files is True:
-            logger.debug(f"updating file")
+            logger.debug("updating file")
             service.files().update(fileId=fid, media_body=media, fields="id").execute()
         else:
-            logger.debug(f"skipping file")
+            logger.debug("skipping file")
 
 
 def backup() -> bool:
@@ -25,7 +25,7 @@ class GUIWidget(QWidget):
 
         """
         super(GUIWidget, self).__init__(parent=parent)
-        logger.debug(f"initialised {type(self)}")
+        logger.debug("initialised %s", type(self))
 
         self.instructions = get_instructions("gui", self.parent().kwds["language"])
 
@@ -102,7 +102,8 @@ class GUIWidget(QWidget):
 
     def _update_proband_lists(self) -> None:
         """The Tests and Notes tabs have proband boxes that need to be updated."""
+        probands = proband_pickles()
         self.test_widget.proband_id_box.clear()
-        self.test_widget.proband_id_box.addItems(["TEST"] + sorted(proband_pickles()))
+        self.test_widget.proband_id_box.addItems(["TEST"] + probands)
         self.notes_widget.proband_id_box.clear()
-        self.notes_widget.proband_id_box.addItems(sorted(proband_pickles()))
+        self.notes_widget.proband_id_box.addItems(probands)
@@ -0,0 +1,136 @@
+"""Defines an append-only journal for procedures.
+
+"""
+from logging import getLogger
+from os import fsync
+from os.path import exists, getsize
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from struct import Struct
+from typing import Iterator, Tuple
+
+logger = getLogger(__name__)
+_header = Struct("<I")
+
+
+class Journal(object):
+    def __init__(self, path: str, seq: int = 0, fsync_every: int = 1) -> None:
+        """Write-ahead journal.
+
+        Journals contain one record per event (e.g., a completed trial) and are only
+        ever appended to, which is much cheaper than re-pickling the whole procedure
+        after every trial. Each record is a pickled `(seq, kind, payload)` tuple
+        preceded by its length, so a record torn by a crash or power cut can be
+        detected and discarded when the journal is read back.
+
+        Records are flushed to the operating system as soon as they are appended.
+        Flushing them to the disk itself (`os.fsync`) is slow on SD cards, so this is
+        done once every `fsync_every` records (group commit) and whenever `sync` is
+        called explicitly.
+
+        Args:
+            path (str): Path to the journal file.
+            seq (:obj:`int`, optional): Sequence number of the last record already
+                applied to the snapshot.
+            fsync_every (:obj:`int`, optional): Number of records per fsync.
+
+        """
+        logger.debug("initialised %s with path=%s", type(self), path)
+        self.path = path
+        self.seq = seq
+        self.fsync_every = max(1, int(fsync_every))
+        self._file = None
+        self._unsynced = 0
+        self._valid_end = 0
+
+    def read(self, after: int = 0) -> Iterator[Tuple[int, str, object]]:
+        """Iterate over the records in the journal.
+
+        Stops silently at the first incomplete or corrupt record.
+
+        Args:
+            after (:obj:`int`, optional): Skip records with sequence numbers less than
+                or equal to this.
+
+        Yields:
+            tuple: Sequence number, kind, and payload of each record.
+
+        """
+        self._valid_end = 0
+        if not exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                head = f.read(_header.size)
+                if len(head) < _header.size:
+                    break
+                (n,) = _header.unpack(head)
+                body = f.read(n)
+                if len(body) < n:
+                    logger.warning("discarding torn record at end of %s", self.path)
+                    break
+                try:
+                    seq, kind, payload = loads(body)
+                except Exception:
+                    logger.warning("discarding corrupt record in %s", self.path)
+                    break
+                self._valid_end = f.tell()
+                self.seq = max(self.seq, seq)
+                if seq > after:
+                    yield seq, kind, payload
+
+    def _open(self) -> None:
+        """Open the file for appending, dropping any torn record at the end."""
+        self._file = open(self.path, "ab")
+        if exists(self.path) and getsize(self.path) > self._valid_end:
+            if self._valid_end == 0:
+                for _ in self.read():
+                    pass
+            self._file.truncate(self._valid_end)
+
+    def append(self, kind: str, payload: object) -> int:
+        """Append a record.
+
+        Args:
+            kind (str): Kind of record (e.g., "trials").
+            payload (object): Any picklable object.
+
+        Returns:
+            int: Sequence number of the new record.
+
+        """
+        if self._file is None:
+            self._open()
+        self.seq += 1
+        body = dumps((self.seq, kind, payload), HIGHEST_PROTOCOL)
+        self._file.write(_header.pack(len(body)) + body)
+        self._file.flush()
+        self._valid_end = self._file.tell()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+        return self.seq
+
+    def sync(self) -> None:
+        """Force all appended records onto the disk."""
+        if self._file is not None and self._unsynced > 0:
+            fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def truncate(self) -> None:
+        """Discard all records, e.g., once they are contained in a new snapshot.
+
+        Sequence numbers keep increasing, so records written before a crash during
+        checkpointing can still be recognised as stale.
+
+        """
+        logger.debug("truncating %s", self.path)
+        self.close()
+        open(self.path, "wb").close()
+        self._valid_end = 0
+
+    def close(self) -> None:
+        """Sync and close the file."""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
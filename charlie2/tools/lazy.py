@@ -0,0 +1,43 @@
+"""Defines deferred imports for heavy modules which are not needed at startup.
+
+"""
+from importlib import import_module
+from logging import getLogger
+from time import perf_counter
+from types import ModuleType
+
+logger = getLogger(__name__)
+
+
+class LazyModule(object):
+    def __init__(self, name: str) -> None:
+        """Stand-in for a module which is imported the first time it is used.
+
+        Some dependencies take a long time to import (pandas, the Google Drive client
+        libraries, docutils) but are only needed for occasional tasks such as writing
+        summaries or backing up. Importing them at the top of a module adds their
+        import time to the app's startup time. Instead, a module can assign
+        `pd = LazyModule("pandas")` and use `pd` as usual; the real module is imported
+        (and the time this took logged) on the first attribute access.
+
+        Args:
+            name (str): Full name of the module.
+
+        """
+        self._name = name
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            t0 = perf_counter()
+            self._module = import_module(self._name)
+            ms = (perf_counter() - t0) * 1000
+            logger.debug("imported %s on first use in %.1f ms", self._name, ms)
+        return self._module
+
+    def __getattr__(self, attr: str) -> object:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
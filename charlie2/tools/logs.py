@@ -0,0 +1,110 @@
+"""Defines the logging set-up used when running the app.
+
+"""
+from atexit import register
+from logging import INFO, Formatter, LogRecord, getLevelName, getLogger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from os import environ
+from os.path import exists
+from queue import SimpleQueue
+from typing import Dict, Union
+
+logger = getLogger(__name__)
+_listener = None
+log_format = "%(asctime)s::%(name)s::%(levelname)s::%(message)s"
+max_log_bytes = 10 * 1024 * 1024
+log_backups = 3
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Parse per-module logging levels.
+
+    The specification is a comma-separated list of `module=LEVEL` pairs; a bare level
+    applies to the root logger. For example, "INFO,charlie2.tools.procedure=WARNING"
+    logs information messages from everywhere except the procedure, which only logs
+    warnings and errors.
+
+    Args:
+        spec (str): The specification.
+
+    Returns:
+        dict: Levels keyed by logger name ("" for the root logger).
+
+    """
+    levels = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, level = item.rpartition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler which leaves formatting to the listener thread.
+
+    `QueueHandler.prepare` formats each message on the thread that logged it, which
+    is usually the GUI thread. Here records are queued as they are, and the handler on
+    the listener thread merges the arguments into the message when it writes the
+    record. Arguments are therefore formatted a little later than they were logged.
+
+    """
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+def setup_logging(
+    filename: str = "charlie.log",
+    level: Union[int, str] = INFO,
+    levels: Dict[str, str] = None,
+) -> QueueListener:
+    """Send log records to a rotating file from a background thread.
+
+    Writing each record to disk on the thread that logged it means every debug message
+    from a trial stalls the GUI until the write completes. Instead, the root logger
+    gets a `DeferredQueueHandler`, which puts the record on a queue, and a
+    `QueueListener` thread takes records off the queue, formats them, and writes them
+    to the file. Each run starts a new file, and the file is also rotated once it
+    reaches `max_log_bytes`; `log_backups` old files are kept.
+
+    The root logger logs information messages and above by default. Levels can be set
+    per module, so that debug output can be turned on for some modules only. They are
+    taken from `levels` and then from the `CHARLIE2_LOG` environment variable (see
+    `parse_levels`); unknown level names are ignored with a warning rather than
+    stopping the app. Records below a logger's level are discarded before their
+    messages are formatted, so disabled debug calls using %-style arguments cost
+    almost nothing.
+
+    Args:
+        filename (:obj:`str`, optional): Path to the log file.
+        level (:obj:`int` or :obj:`str`, optional): Level of the root logger.
+        levels (:obj:`dict`, optional): Levels keyed by logger name.
+
+    Returns:
+        QueueListener: The running listener, which is stopped at exit.
+
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handler = RotatingFileHandler(
+        filename, maxBytes=max_log_bytes, backupCount=log_backups, delay=True
+    )
+    if exists(filename):
+        handler.doRollover()
+    handler.setFormatter(Formatter(log_format))
+    queue = SimpleQueue()
+    root = getLogger()
+    root.addHandler(DeferredQueueHandler(queue))
+    root.setLevel(level)
+    levels = {**(levels or {}), **parse_levels(environ.get("CHARLIE2_LOG", ""))}
+    for name, level_ in list(levels.items()):
+        if not isinstance(getLevelName(level_), int):
+            logger.warning("ignoring unknown logging level %r for %r", level_, name)
+            del levels[name]
+            continue
+        getLogger(name or None).setLevel(level_)
+    _listener = QueueListener(queue, handler, respect_handler_level=True)
+    _listener.start()
+    register(_listener.stop)
+    logger.debug("logging to %s with levels %s", filename, levels)
+    return _listener
@@ -4,13 +4,17 @@
 from datetime import datetime
 from logging import getLogger
 from sys import exit, platform
+from typing import Callable, Union
 
-from httplib2 import ServerNotFoundError
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QCloseEvent
-from PyQt5.QtWidgets import QDesktopWidget, QMainWindow
+from PyQt5.QtWidgets import QDesktopWidget, QMainWindow, QMessageBox
 
 from .gui import GUIWidget
-from .paths import durations_path, get_test
+from .paths import durations_path, get_error_messages, get_test
+from .persistence import get_worker
+from .storage import get_storage
+from .warmup import TestPreparer
 
 logger = getLogger(__name__)
 window_size = (1000, 750)
@@ -27,7 +31,7 @@ class MainWindow(QMainWindow):
 
         """
         super(MainWindow, self).__init__(parent)
-        logger.debug(f"initialised {type(self)}")
+        logger.debug("initialised %s", type(self))
 
         logger.debug("loading default keywords")
         self.kwds = {
@@ -39,24 +43,36 @@ class MainWindow(QMainWindow):
             "resumable": False,
             "gui": True,
         }
-        logger.debug("keywords are %s" % str(self.kwds))
+        logger.debug("keywords are %s", self.kwds)
 
         logger.debug("getting desktop dimensions")
         self.desktop_size = QDesktopWidget().availableGeometry().size()
-        logger.debug("dimensions are %s" % str(self.desktop_size))
+        logger.debug("dimensions are %s", self.desktop_size)
 
         logger.debug("starting a rough timer")
         self.time_started = datetime.now()
 
         logger.debug("starting the app proper")
         self.ignore_close_event = False
+
+        logger.debug("preparing to warm up tests in batches")
+        self.preparer = TestPreparer()
+        self.preparer.ready.connect(self._build_next_test)
+        self.preparer.built.connect(self._attach_procedure)
+        self._preparing = None
+        self._building = None
+        self._prepared = {}
+
         self.switch_central_widget()
 
     def switch_central_widget(self) -> None:
         """Switch the central widget.
         
         Show the GUI, move from one test to another, or close the app. This method
-        also checks whether a test should be resumed.
+        also checks whether a test should be resumed. Tests that the proband has already
+        completed are skipped, using the status index rather than loading their data.
+        If the next test was prepared while the previous one ran (see
+        `prepare_next_test`), its widget is shown straight away.
 
         """
         logger.debug("called switch_central_widget()")
@@ -78,15 +94,27 @@ class MainWindow(QMainWindow):
 
             logger.debug("showing the gui")
             self.setCentralWidget(gui)
+            self._discard_prepared()
 
         elif len(self.kwds["test_names"]) > 0:
 
             logger.debug("at least one test in test_names")
             self.kwds["test_name"] = self.kwds["test_names"].pop(0)
 
-            logger.debug(f"initialising {self.kwds['test_name']}")
-            w = get_test(self.kwds["test_name"])
-            widget = w(self)
+            pid, test_name = self.kwds["proband_id"], self.kwds["test_name"]
+            status = get_storage().status(pid, test_name)
+            if status is not None and status["status"] == "completed":
+                logger.debug("%s already completed, skipping", self.kwds["test_name"])
+                return self.switch_central_widget()
+
+            self._attach_procedure(self.kwds["test_name"])
+            widget = self._prepared.pop(self.kwds["test_name"], None)
+            if widget is None:
+                logger.debug("initialising %s", self.kwds["test_name"])
+                w = get_test(self.kwds["test_name"])
+                widget = w(self)
+            else:
+                logger.debug("using prepared %s", self.kwds["test_name"])
 
             if not self.kwds["fullscreen"] or platform == "darwin":
                 logger.debug("showing the window in normal mode")
@@ -108,7 +136,125 @@ class MainWindow(QMainWindow):
             widget.begin()
 
         else:
-            exit()
+            self._discard_prepared()
+            get_worker().flush()
+            self.check_saved(then=exit)
+
+    def _next_test_name(self) -> Union[str, None]:
+        """Returns the name of the next test in the batch that is not completed."""
+        pid = self.kwds.get("proband_id")
+        for test_name in self.kwds["test_names"]:
+            if not test_name:
+                continue
+            status = get_storage().status(pid, test_name)
+            if status is None or status["status"] != "completed":
+                return test_name
+        return None
+
+    def prepare_next_test(self) -> None:
+        """Start preparing the next test of a batch, if there is one.
+
+        Called by the current test when its final block starts. The next test is warmed
+        up in the background (see `TestPreparer`), then its widget is created and its
+        procedure and trial list are built in the background, so that
+        `switch_central_widget` can show it straight away.
+
+        """
+        test_name = self._next_test_name()
+        busy = {self._preparing, *self._prepared}
+        if self._building is not None:
+            busy.add(self._building[0])
+        if test_name is None or test_name in busy:
+            return
+        logger.debug("preparing %s", test_name)
+        self._preparing = test_name
+        self.preparer.prepare(test_name, self.kwds["language"])
+
+    def _build_next_test(self, test_name: str) -> None:
+        """Create the widget of a warmed-up test and start building its procedure.
+
+        The widget is not shown until it becomes the central widget. Its procedure is
+        built on the preparer's thread, so that the current test is not held up.
+
+        """
+        self._preparing = None
+        if test_name != self._next_test_name():
+            logger.debug("%s is no longer the next test", test_name)
+            return
+        logger.debug("creating %s", test_name)
+        current, self.kwds["test_name"] = self.kwds["test_name"], test_name
+        try:
+            widget = get_test(test_name)(self)  # copies kwds, so swap test_name
+        finally:
+            self.kwds["test_name"] = current
+        future = self.preparer.build(test_name, widget.make_procedure)
+        self._building = (test_name, widget, future)
+
+    def _attach_procedure(self, test_name: str) -> None:
+        """Give a test being prepared its procedure once it has been built.
+
+        Called when the preparer has built the procedure, and by
+        `switch_central_widget` before showing a test, in which case this waits for
+        the procedure if it is still being built.
+
+        """
+        if self._building is None or self._building[0] != test_name:
+            return
+        _, widget, future = self._building
+        self._building = None
+        try:
+            widget.procedure = future.result()
+        except Exception as e:
+            # the test will be set up from scratch when it starts
+            logger.warning("could not prepare %s: %s", test_name, e)
+            widget.deleteLater()
+            return
+        logger.debug("prepared %s", test_name)
+        self._prepared[test_name] = widget
+
+    def _discard_prepared(self) -> None:
+        """Throw away prepared tests, e.g., because the batch ended early.
+
+        Their procedures have not written anything to disk yet, so they are simply
+        dropped rather than closed.
+
+        """
+        if self._building is not None:
+            self._attach_procedure(self._building[0])
+        for widget in self._prepared.values():
+            widget.deleteLater()
+        self._prepared = {}
+
+    def check_saved(self, then: Callable[[], None] = None) -> None:
+        """Warn the experimenter if any data could not be saved.
+
+        Failed writes only show up in the log, so after flushing the persistence worker
+        (e.g., when a test closes) this shows a warning if any jobs have failed since
+        the last check. The warning does not block, so the next test or the GUI
+        carries on behind it.
+
+        Args:
+            then (:obj:`callable`, optional): Called once the warning has been
+                dismissed, or straight away if there is no warning.
+
+        """
+        failed = get_worker().new_errors()
+        if failed == 0:
+            if then is not None:
+                then()
+            return
+        logger.warning("%s persistence jobs failed", failed)
+        message_box = QMessageBox(self)
+        message_box.setAttribute(Qt.WA_DeleteOnClose)
+        message_box.setIcon(QMessageBox.Warning)
+        try:
+            msg = get_error_messages(self.kwds["language"], "data_not_saved")
+        except (ImportError, KeyError):
+            msg = get_error_messages("en", "data_not_saved")
+        message_box.setText(msg % failed)
+        if then is not None:
+            message_box.finished.connect(lambda _: then())
+        message_box.open()
 
     def _centre(self) -> None:
         """Move normal window to centre of screen."""
@@ -124,6 +270,9 @@ class MainWindow(QMainWindow):
         test or batch launched from the GUI. This method takes the user back to the GUI
         under such circumstances.
 
+        Any data still waiting to be written by the persistence worker are flushed to
+        disk before the app exits or a test is closed.
+
         It also prevents a test from closing when  `ignore_close_event` is True. This is
         used to prevent crashes to desktop when a `closeEvent` events at an awkward time
         during a test, for instance while waiting for a stimulus to disappear from the
@@ -145,7 +294,9 @@ class MainWindow(QMainWindow):
                 duration = datetime.now() - self.time_started
                 s = ",".join([str(duration), str(self.time_started)]) + "\n"
                 open(durations_path, "a").write(s)
-                exit()
+                get_worker().flush()
+                event.ignore()  # keep the window open behind any warning
+                self.check_saved(then=exit)
             else:
                 logger.debug("at a test, safely closing")
                 self.centralWidget().safe_close()
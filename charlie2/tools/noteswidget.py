@@ -24,7 +24,7 @@ class NotesWidget(QWidget):
 
         """
         super(NotesWidget, self).__init__(parent=parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         logger.debug("creating graphical elements of notes widget")
 
@@ -67,7 +67,7 @@ class NotesWidget(QWidget):
 
     def _load(self) -> None:
         """Load notes for a given subject."""
-        logger.debug("load proband with id: %s" % self.proband_id_box.currentText())
+        logger.debug("load proband with id: %s", self.proband_id_box.currentText())
         self.proband = Proband(proband_id=self.proband_id_box.currentText())
         self._reset()
 
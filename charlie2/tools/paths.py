@@ -1,20 +1,27 @@
 """Contains paths to all files in the battery.
 
 """
+from ast import get_docstring, parse
 from copy import copy
+from hashlib import sha256
 from importlib import import_module
+from json import dump, load
 from logging import getLogger
 from os import listdir as ls
+from os import replace
 from os.path import dirname
 from os.path import join as pj
+from os.path import relpath
 from pkgutil import iter_modules
 from typing import List, Union
 
-from docutils.core import publish_string
-
 import charlie2
 
+from .lazy import LazyModule
+
 logger = getLogger(__name__)
+docutils_core = LazyModule("docutils.core")
+_docstrings = None
 
 _path = dirname(charlie2.__file__)
 
@@ -25,12 +32,14 @@ last_backed_up = pj(meta_data_path, "last_backed_up.pkl")
 credentials_path = pj(meta_data_path, "credentials.json")
 token_path = pj(meta_data_path, "token.json")
 durations_path = pj(meta_data_path, "durations.csv")
+docstrings_path = pj(meta_data_path, "docstrings.json")
 
 current_data_path = pj(data_path, "current")
 proband_path = pj(current_data_path, "probands")
 test_data_path = pj(current_data_path, "tests")
 csv_path = pj(current_data_path, "csv")
 summaries_path = pj(current_data_path, "summaries")
+database_path = pj(current_data_path, "database", "charlie2.db")
 
 previous_data_path = pj(data_path, "data", "old")
 prev_proband_path = pj(previous_data_path, "probands")
@@ -55,11 +64,10 @@ logo_path = pj(_path, "logo", "charlie.png")
 
 
 def proband_pickles() -> Union[List[str], List]:
-    """Returns a sorted list of probands IDs determined by contents of the proband data
-    directory.
+    """Returns a sorted list of probands IDs from the storage backend."""
+    from .storage import get_storage  # storage imports this module
 
-    """
-    return sorted(p.replace(".pkl", "") for p in ls(proband_path) if p.endswith(".pkl"))
+    return get_storage().proband_ids()
 
 
 def is_test(s: str) -> bool:
@@ -97,7 +105,7 @@ def get_instructions(s: str, lang: str) -> List[str]:
     Returns:
         list: List of strings.
     """
-    logger.debug("getting instructions for %s in language %s" % (s, lang))
+    logger.debug("getting instructions for %s in language %s", s, lang)
     lst = _get_common_instructions(lang)
     lst += _get_instructions(s, lang)
     return lst
@@ -179,16 +187,55 @@ def get_error_messages(lang: str, name: str) -> str:
     return import_module(f"charlie2.instructions.{lang}.errors").__dict__[name]
 
 
+def _load_docstrings() -> dict:
+    """Returns the cache of rendered docstrings, or an empty one if unreadable."""
+    try:
+        with open(docstrings_path) as f:
+            return load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_docstrings(cache: dict) -> None:
+    """Write the cache of rendered docstrings atomically."""
+    try:
+        with open(docstrings_path + ".tmp", "w") as f:
+            dump(cache, f)
+        replace(docstrings_path + ".tmp", docstrings_path)
+    except OSError as e:
+        logger.warning("could not save docstring cache: %s", e)
+
+
 def get_docstring_html(s: str) -> object:
     """Returns the docstring of a given test, converted from markdown into html.
 
+    Rendering reStructuredText with docutils is slow, so the HTML is cached in
+    `docstrings_path`, keyed by the path of the test module and a hash of its source.
+    If the module has not changed since it was last rendered, this costs one file
+    read (the cache itself is only read once). Otherwise, the docstring is taken from
+    the source without importing the module, rendered, and the cache updated.
+
     Args:
         s: Test name.
 
     Returns:
         str: HTML-formatted docstring.
     """
-    d = import_module(f"charlie2.tests.{s}").__doc__
-    html = publish_string(source=d, writer_name="html").decode()
+    global _docstrings
+    path = pj(tests_path, f"{s}.py")
+    with open(path, "rb") as f:
+        source = f.read()
+    key = relpath(path, _path)
+    digest = sha256(source).hexdigest()
+    if _docstrings is None:
+        _docstrings = _load_docstrings()
+    entry = _docstrings.get(key)
+    if entry is not None and entry["sha256"] == digest:
+        return entry["html"]
+    logger.debug("rendering docstring of %s", key)
+    d = get_docstring(parse(source), clean=False)
+    html = docutils_core.publish_string(source=d, writer_name="html").decode()
     html = html[html.find("<body>") + 6 : html.find("</body>")].strip()
+    _docstrings[key] = {"sha256": digest, "html": html}
+    _save_docstrings(_docstrings)
     return html
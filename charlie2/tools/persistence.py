@@ -0,0 +1,101 @@
+"""Defines a background worker for writing data to disk.
+
+"""
+from logging import getLogger
+from queue import Queue
+from threading import Event, Thread
+from typing import Callable
+
+logger = getLogger(__name__)
+_worker = None
+
+
+class PersistenceWorker(object):
+    def __init__(self, maxsize: int = 256) -> None:
+        """Persistence worker.
+
+        Writing csv files, journals and snapshots can take tens of milliseconds, which
+        is too long to spend on the GUI thread between trials. Instead, these jobs are
+        submitted to a single background thread and run there in the order they were
+        submitted. Because the order is preserved, a job can rely on all previously
+        submitted jobs having finished.
+
+        The queue is bounded. If the disk cannot keep up, `submit` blocks until there is
+        room, rather than letting unsaved data pile up in memory.
+
+        A job which raises an exception is logged and counted in `errors`, and the
+        worker carries on with the next job. Use `new_errors` after `flush` to find out
+        whether any data could not be saved, so the experimenter can be warned.
+
+        Jobs must only be given data that will not be modified afterwards (e.g., a copy
+        of a completed trial), since they run at some unknown later time.
+
+        Args:
+            maxsize (:obj:`int`, optional): Maximum number of pending jobs.
+
+        """
+        logger.debug("initialised %s with maxsize=%s", type(self), maxsize)
+        self._queue = Queue(maxsize)
+        self._thread = Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+        self.errors = 0
+        self._reported = 0
+
+    def _run(self) -> None:
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception:
+                self.errors += 1
+                logger.exception("persistence job %s failed", func)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func: Callable, *args) -> None:
+        """Run `func(*args)` on the background thread.
+
+        Args:
+            func (callable): The job.
+            *args: Arguments passed to the job.
+
+        """
+        self._queue.put((func, args))
+
+    def barrier(self) -> Event:
+        """Returns an event that is set once all jobs submitted so far have finished.
+
+        Unlike `flush`, this does not block, so the caller can carry on and check or
+        wait on the event later.
+
+        """
+        event = Event()
+        self.submit(event.set)
+        return event
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until all jobs submitted so far have finished.
+
+        Args:
+            timeout (:obj:`float`, optional): Give up after this many seconds.
+
+        Returns:
+            bool: True if all jobs finished, False if timed out.
+
+        """
+        logger.debug("flushing persistence worker")
+        return self.barrier().wait(timeout)
+
+    def new_errors(self) -> int:
+        """Returns the number of jobs that have failed since this was last called."""
+        errors = self.errors
+        n, self._reported = errors - self._reported, errors
+        return n
+
+
+def get_worker() -> PersistenceWorker:
+    """Returns the persistence worker shared by the whole app."""
+    global _worker
+    if _worker is None:
+        _worker = PersistenceWorker()
+    return _worker
@@ -0,0 +1,167 @@
+"""Defines a cache of decoded images.
+
+"""
+from collections import OrderedDict
+from logging import getLogger
+from os import environ
+from typing import Callable, Tuple, Union
+
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QPixmap
+
+logger = getLogger(__name__)
+_cache = None
+default_budget = 64 * 1024 * 1024
+
+
+class PixmapCache(object):
+    def __init__(self, budget: int = default_budget) -> None:
+        """Least-recently-used cache of decoded pixmaps.
+
+        Decoding a PNG is by far the most expensive part of showing an image. Pixmaps
+        are therefore cached, keyed by path and target size, so each image is read
+        from disk and decoded at most once while it remains in the cache. `QPixmap`
+        objects are implicitly shared, so handing out the cached pixmap costs nothing.
+
+        The cache holds at most `budget` bytes of pixel data. When it is full, the
+        least recently used pixmaps are evicted first.
+
+        Pixmaps can only be created on the GUI thread, so neither can this cache be
+        used from any other thread.
+
+        Args:
+            budget (:obj:`int`, optional): Maximum size of the cache in bytes.
+
+        """
+        logger.debug("initialised %s with budget=%s", type(self), budget)
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pixmaps = OrderedDict()
+
+    @staticmethod
+    def _size_of(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(
+        self,
+        path: str,
+        size: Union[None, Tuple[int, int]] = None,
+        decode: Callable[[str], Union[None, QPixmap]] = None,
+    ) -> QPixmap:
+        """Returns the pixmap for an image, decoding it only if it is not cached.
+
+        Args:
+            path (str): Path to the image file.
+            size (:obj:`tuple` of :obj:`int`, optional): Scale the image to fit within
+                this width and height, keeping its aspect ratio.
+            decode (:obj:`callable`, optional): Called with `path` to get the pixmap if
+                the image is not cached, e.g., from an already decoded image. If it
+                returns None, or is not given, the file is decoded.
+
+        Returns:
+            QPixmap: The pixmap.
+
+        """
+        key = (path, size)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self.hits += 1
+            self._pixmaps.move_to_end(key)
+            return pixmap
+        self.misses += 1
+        if size is None:
+            pixmap = self._decode(path, decode)
+        else:
+            pixmap = self._pixmaps.get((path, None))
+            if pixmap is None:
+                pixmap = self._decode(path, decode)
+                self.insert((path, None), pixmap)
+            pixmap = pixmap.scaled(
+                QSize(*size), Qt.KeepAspectRatio, Qt.SmoothTransformation
+            )
+        self.insert(key, pixmap)
+        return pixmap
+
+    @staticmethod
+    def _decode(path: str, decode: Callable = None) -> QPixmap:
+        pixmap = None if decode is None else decode(path)
+        if pixmap is not None:
+            return pixmap
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            logger.warning("could not load image %s", path)
+        return pixmap
+
+    def insert(self, key: Tuple[str, Union[None, tuple]], pixmap: QPixmap) -> None:
+        """Add a pixmap to the cache, evicting others if necessary."""
+        if key in self._pixmaps:
+            self.nbytes -= self._size_of(self._pixmaps.pop(key))
+        self._pixmaps[key] = pixmap
+        self.nbytes += self._size_of(pixmap)
+        self._evict()
+
+    def set_budget(self, budget: int) -> None:
+        """Change the maximum size of the cache, evicting pixmaps if necessary."""
+        logger.debug("changing budget from %s to %s", self.budget, budget)
+        self.budget = budget
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.nbytes > self.budget and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.nbytes -= self._size_of(evicted)
+            self.evictions += 1
+
+    def __contains__(self, key: Tuple[str, Union[None, Tuple[int, int]]]) -> bool:
+        return key in self._pixmaps
+
+    def clear(self) -> None:
+        """Empty the cache."""
+        self._pixmaps.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counts, and current size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pixmaps": len(self._pixmaps),
+            "nbytes": self.nbytes,
+            "budget": self.budget,
+        }
+
+
+def get_pixmap_cache(budget: int = None) -> PixmapCache:
+    """Returns the pixmap cache shared by the whole app.
+
+    The budget is taken from `budget` if given, otherwise from the
+    `CHARLIE2_PIXMAP_CACHE_MB` environment variable (in megabytes), otherwise
+    `default_budget`. Passing a budget once the cache exists changes its budget.
+
+    Args:
+        budget (:obj:`int`, optional): Maximum size of the cache in bytes.
+
+    """
+    global _cache
+    if _cache is None:
+        if budget is None:
+            budget = _budget_from_environ()
+        _cache = PixmapCache(budget)
+    elif budget is not None and budget != _cache.budget:
+        _cache.set_budget(budget)
+    return _cache
+
+
+def _budget_from_environ() -> int:
+    mb = environ.get("CHARLIE2_PIXMAP_CACHE_MB")
+    if not mb:
+        return default_budget
+    try:
+        return int(float(mb) * 1024 * 1024)
+    except ValueError:
+        logger.warning("ignoring invalid CHARLIE2_PIXMAP_CACHE_MB=%r", mb)
+        return default_budget
@@ -0,0 +1,100 @@
+"""Defines a prefetcher for images needed by upcoming trials.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from time import perf_counter
+from typing import Iterable, Union
+
+from PyQt5.QtGui import QImage
+
+logger = getLogger(__name__)
+_prefetcher = None
+
+
+def decode_image(path: str) -> QImage:
+    """Decode an image file. Unlike pixmaps, images can be created on any thread."""
+    image = QImage(path)
+    if image.isNull():
+        logger.warning("could not decode image %s", path)
+    return image
+
+
+class Prefetcher(object):
+    def __init__(self, workers: int = 1) -> None:
+        """Stimulus prefetcher.
+
+        Tests declare which stimuli each trial needs (see
+        `BaseTestWidget.stimuli`). Before a trial starts, the stimuli of the next few
+        trials are passed to `schedule`, and their images are decoded into `QImage`
+        objects on a background thread. (Sounds are not prefetched, because the audio
+        bank already preloads them.) When a trial needs one of these images, `take`
+        returns it, waiting for it only if decoding has not finished yet.
+
+        Each call to `take` is counted as a hit (the stimulus was ready), late (it was
+        still being decoded), or a miss (it was never scheduled). `wait_s` is the total
+        time spent waiting for late stimuli.
+
+        Args:
+            workers (:obj:`int`, optional): Number of background threads.
+
+        """
+        logger.debug("initialised %s with workers=%s", type(self), workers)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="prefetch")
+        self._futures = {}
+        self.hits = 0
+        self.late = 0
+        self.misses = 0
+        self.wait_s = 0.0
+
+    def schedule(self, paths: Iterable[str]) -> None:
+        """Start decoding these stimuli, and forget any others not yet taken.
+
+        Args:
+            paths (:obj:`iterable` of :obj:`str`): Paths to the stimuli needed soon.
+
+        """
+        paths = list(dict.fromkeys(paths))
+        for path in set(self._futures) - set(paths):
+            self._futures.pop(path).cancel()
+        for path in paths:
+            if path not in self._futures:
+                self._futures[path] = self._executor.submit(decode_image, path)
+
+    def take(self, path: str) -> Union[None, QImage]:
+        """Returns a decoded image, or None if it was not scheduled.
+
+        Args:
+            path (str): Path to the stimulus.
+
+        """
+        future = self._futures.pop(path, None)
+        if future is None:
+            self.misses += 1
+            return None
+        if future.done():
+            self.hits += 1
+            return future.result()
+        self.late += 1
+        t0 = perf_counter()
+        result = future.result()
+        self.wait_s += perf_counter() - t0
+        return result
+
+    def stats(self) -> dict:
+        """Returns the hit, late and miss counts."""
+        return {
+            "hits": self.hits,
+            "late": self.late,
+            "misses": self.misses,
+            "wait_s": self.wait_s,
+            "pending": len(self._futures),
+        }
+
+
+def get_prefetcher() -> Prefetcher:
+    """Returns the prefetcher shared by the whole app."""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher()
+    return _prefetcher
@@ -3,12 +3,10 @@
 """
 from datetime import datetime
 from logging import getLogger
-from os import remove
-from os.path import exists
 from os.path import join as pj
-from pickle import dump, load
 
 from .paths import proband_path
+from .storage import get_storage
 
 logger = getLogger(__name__)
 forbidden_ids = {"TEST", ""}
@@ -19,8 +17,8 @@ class Proband(object):
         """Proband object.
 
         These objects contain information about the current proband, such as their ID,
-        when they were tested, etc. This information is saved in a special .pkl file
-        (really just a pickled python dictionary).
+        when they were tested, etc. This information is saved via the storage backend
+        (by default, a special .pkl file, really just a pickled python dictionary).
 
         Kwds:
             proband_id (str): The proband ID. This is the only keyword required at
@@ -31,7 +29,7 @@ class Proband(object):
                 4. Automatically determined based on `proband_id`.
 
         """
-        logger.debug(f"initialised {type(self)} with {kwds}")
+        logger.debug("initialised %s with %s", type(self), kwds)
         assert "proband_id" in kwds, "proband_id must be a keyword argument"
 
         self.proband_id = kwds["proband_id"]
@@ -53,20 +51,21 @@ class Proband(object):
         self.data = {**defaults, **stored, **kwds, **autos}
         self.update()
 
-        logger.debug(f"fully initialised, looks like {self.data}")
+        logger.debug("fully initialised, looks like %s", self.data)
 
     def load(self) -> dict:
         """Load data from disk if any exist."""
         logger.debug("called load()")
         dic = {}
-        if exists(self.path):
+        stored = get_storage().load_proband(self.proband_id)
+        if stored is not None:
             logger.debug("data belonging to proband with this id already exists")
-            dic.update(load(open(self.path, "rb")))
+            dic.update(stored)
             dic["last_loaded"] = datetime.now()
         else:
             logger.debug("data belonging to proband with this id not found on disk")
             dic["created"] = datetime.now()
-        logger.debug(f"loaded data looks like this: {dic}")
+        logger.debug("loaded data looks like this: %s", dic)
         return dic
 
     def save(self) -> None:
@@ -76,7 +75,7 @@ class Proband(object):
             self.backup()
             logger.debug("saving the data")
             self.data["last_saved"] = datetime.now()
-            dump(self.data, open(self.path, "wb"))
+            get_storage().save_proband(self.data)
         else:
             logger.debug("not saving the data: forbidden ID")
         self.update()
@@ -90,8 +89,7 @@ class Proband(object):
         """Delete the proband from disk."""
         logger.debug("called delete()")
         self.backup()
-        if exists(self.path):
-            remove(self.path)
+        get_storage().delete_proband(self.proband_id)
 
     def backup(self) -> None:
         """Make a backup."""
@@ -2,7 +2,6 @@
 
 """
 from logging import getLogger
-from os import remove
 from re import match
 
 from PyQt5.QtWidgets import (
@@ -28,7 +27,7 @@ class ProbandWidget(QWidget):
 
         """
         super(ProbandWidget, self).__init__(parent=parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # instructions
         self.instructions = self.parent().instructions
@@ -177,7 +176,7 @@ class ProbandWidget(QWidget):
     def _delete_proband(self) -> None:
         """Delete the ID."""
         if self.proband.proband_id in proband_pickles():
-            remove(self.proband.path)
+            self.proband.delete()
             self._set_proband(proband_pickles()[0])
 
     @staticmethod
@@ -1,23 +1,29 @@
 """Defines a custom Procedure object. Add more procedure classes in the future.
 
 """
+from copy import copy
 from datetime import datetime
 from getpass import getuser
 from logging import getLogger
-from os.path import exists
 from os.path import join as pj
-from pickle import dump, load
 from socket import gethostname
 from sys import platform
-from typing import Union
-
-import pandas as pd
+from typing import List, Union
 
+from .csvwriter import TrialWriter, write_csv
+from .journal import Journal
+from .lazy import LazyModule
 from .paths import csv_path, summaries_path, test_data_path
+from .persistence import get_worker
 from .proband import forbidden_ids
+from .stats import RunningSummary
+from .storage import get_storage
+from .tracing import traced
 from .trial import Trial
+from .trialindex import TrialIndex
 
 logger = getLogger(__name__)
+pd = LazyModule("pandas")
 
 
 class SimpleProcedure(object):
@@ -25,7 +31,29 @@ class SimpleProcedure(object):
         """SimpleProcedure object.
 
         These objects contain information about a proband and test. This information is
-        saved in a special .pkl file (really just a pickled python dictionary).
+        saved via the storage backend (by default, a special .pkl file, really just a
+        pickled python dictionary).
+
+        Every completed trial, skipped block and new block is also appended to a
+        journal file next to the .pkl file. The .pkl file is only a periodic snapshot;
+        when loading, any journal records newer than the snapshot are replayed on top of
+        it, so a test can be resumed after a crash without losing trials. Nothing is
+        written for a new procedure until its first journal record, which is replaced
+        by a full snapshot for the rest of the journal to build on.
+
+        All writing (csv, journal, snapshots, summaries) happens on the background
+        persistence worker, using copies of the data taken at the time of the call, so
+        the GUI thread never waits for the disk between trials.
+
+        Summary statistics for the groups of trials given by `summary_groups` are kept
+        up to date in `running_summary` as trials are completed (see
+        `charlie2.tools.stats.RunningSummary`). Snapshots store its state as a plain
+        dictionary.
+
+        Completed trials are also indexed in `trial_index` by block number, by any
+        combinations of keys given by `index_keys`, and in a rolling window of the last
+        `index_window` trials (see `charlie2.tools.trialindex.TrialIndex`), so stopping
+        rules don't need to filter `completed_trials`.
 
         Procedure objects are also iterators. When iterated, these objects move trials
         between two special attributes called `remaining_trials` and `completed_trials`.
@@ -49,7 +77,7 @@ class SimpleProcedure(object):
             4. Automatically determined based on `proband_id` and `test_name`.
 
         """
-        logger.debug(f"initialised {type(self)} with {kwds}")
+        logger.debug("initialised %s with %s", type(self), kwds)
 
         # create some keywords automatically
         self.proband_id = proband_id
@@ -57,6 +85,7 @@ class SimpleProcedure(object):
         self.filename = f"{self.proband_id}_{self.test_name}.pkl"
         self.path = pj(test_data_path, self.filename)
         self.csv = pj(csv_path, self.filename.replace(".pkl", ".csv"))
+        self.journal_path = self.path.replace(".pkl", ".journal")
         s = self.filename.replace(".pkl", "_summary.csv")
         self.summary_path = pj(summaries_path, s)
         autos = {
@@ -65,6 +94,7 @@ class SimpleProcedure(object):
             "filename": self.filename,
             "path": self.path,
             "csv": self.csv,
+            "journal_path": self.journal_path,
             "summary_path": self.summary_path,
             "started_timestamp": datetime.now(),
             "finished_timestamp": None,
@@ -81,26 +111,55 @@ class SimpleProcedure(object):
             "completed_trials": [],
             "summary": {},
             "delete_skipped": False,
+            "block_events": [],
+            "journal_seq": 0,
+            "journal_fsync_every": 1,
+            "summary_groups": {},
+            "running_summary": None,
+            "index_keys": [],
+            "index_window": 0,
+            "display_latency_ms_histogram": {},
+            "audio_latency_ms_histogram": {},
         }
+        self.journal = Journal(self.journal_path)
+        self._has_snapshot = False
         stored = self.load()
 
         # store the keywords
         self.data = {**defaults, **stored, **kwds, **autos}
         self.update()
+        self.journal.fsync_every = self.data["journal_fsync_every"]
+        self.journal.seq = max(self.journal.seq, self.data["journal_seq"])
+        self.csv_writer = TrialWriter(self.csv, self.data["completed_trials"])
+        self.running_summary = self._running_summary()
+        self.data["running_summary"] = self.running_summary
+        self.trial_index = TrialIndex(
+            self.data["index_keys"],
+            self.data["index_window"],
+            self.data["completed_trials"],
+        )
 
-        logger.debug(f"fully initialised, looks like {self.data}")
+        logger.debug(
+            "fully initialised with %s completed and %s remaining trials",
+            len(self.data["completed_trials"]),
+            len(self.data["remaining_trials"]),
+        )
 
+    @traced()
     def next(self, current_trial: Union[None, Trial, dict] = None) -> Trial:
         """Iterate one trial.
 
         Iterating involves checking if the test has been completed, defined by having an
         empty remaining_trials list and a non-empty completed_trials list. If so, an
         exception is raised. Otherwise, it checks if the next trial should be skipped.
-        If so, that trial is silently moved to the bottom of the completed_trials list
-        and the iterator is recursively iterated again. If not, the trial is returned.
+        If so, that trial and any skipped trials immediately after it (e.g., the rest of
+        a block skipped by `skip_block`) are silently moved to the bottom of the
+        completed_trials list in one go, and are written to the csv and journal as a
+        single batch. This repeats until a trial that should not be skipped is found,
+        which is returned.
 
-        If the optional `current_trial` is not None, this trial is appended (as a
-        vanilla dict) to the `completed_trials` list.
+        If the optional `current_trial` is not None, this trial is appended to the
+        `completed_trials` list.
 
         Args:
             current_trial: The current trial.
@@ -109,55 +168,79 @@ class SimpleProcedure(object):
             charlie2.tools.trial.Trial: The next trial.
 
         """
-        logger.debug(f"called __next__() with current_trial={current_trial}")
+        logger.debug("called __next__() with current_trial=%s", current_trial)
         self.data["test_started"] = True
 
         if current_trial is not None:
 
             current_trial["finished_timestamp"] = datetime.now()
-            if all([
-                self.data["delete_skipped"] is True,
-                current_trial["status"] == "skipped",
-                len(self.data["completed_trials"]) > 0,
-            ]):
-                pass
-            else:
-                self.data["completed_trials"].append(current_trial)
-
-        self.data["test_completed"] = all(
-            [
-                len(self.data["remaining_trials"]) == 0,
-                len(self.data["completed_trials"]) > 0,
-            ]
-        )
-        self.to_csv()
+            self._complete([current_trial])
 
-        if self.data["test_completed"]:
-            logger.debug("stopping iterations")
-            self.data["finished_timestamp"] = datetime.now()
-            raise StopIteration
+        while True:
+
+            self.data["test_completed"] = all(
+                [
+                    len(self.data["remaining_trials"]) == 0,
+                    len(self.data["completed_trials"]) > 0,
+                ]
+            )
+
+            if self.data["test_completed"]:
+                logger.debug("stopping iterations")
+                self.data["finished_timestamp"] = datetime.now()
+                self.close()
+                raise StopIteration
 
-        else:
             logger.debug("attempting to iterate")
-            trial = self.data["remaining_trials"].pop(0)
-            # trial.update({
-            #     "_remaining_trials_in_test": self.data["remaining_trials"]
-            # })
-            # if "block_number" in trial:
-            #     rt = [t for t in self.data["remaining_trials"] if
-            #           t["block_number"] == trial["block_number"]]
-            #     trial.update({
-            #         "_remaining_trials_in_block": rt
-            #     })
-
-            next_trial = Trial(trial)
-            if next_trial.status == "skipped":
-                logger.debug("skipping")
-                return self.next(dict(next_trial))
-            else:
+            remaining = self.data["remaining_trials"]
+            n = 0
+            while n < len(remaining) and remaining[n].get("status") == "skipped":
+                n += 1
+
+            if n == 0:
                 logger.debug("returning the current trial")
-                return next_trial
+                return Trial(remaining.pop(0))
+
+            logger.debug("skipping %s trials", n)
+            skipped = remaining[:n]
+            del remaining[:n]
+            self._complete(skipped, from_remaining=True)
+
+    def _complete(self, trials: List[dict], from_remaining: bool = False) -> None:
+        """Move finished trials to `completed_trials` and record them as one batch.
 
+        Skipped trials are deleted rather than stored if `delete_skipped` is True,
+        unless no trials have been completed yet.
+
+        Args:
+            trials (:obj:`list` of :obj:`dict`): Finished trials, in order.
+            from_remaining (:obj:`bool`, optional): The trials were taken straight from
+                `remaining_trials`, so need the default attributes of a `Trial` and a
+                finished timestamp.
+
+        """
+        completed = self.data["completed_trials"]
+        snapshots = []
+        for trial in trials:
+            if all([
+                self.data["delete_skipped"] is True,
+                trial["status"] == "skipped",
+                len(completed) > 0,
+            ]):
+                continue
+            if from_remaining:
+                trial = dict(Trial(trial))
+                trial["finished_timestamp"] = datetime.now()
+            snapshot = dict(trial)
+            completed.append(trial)
+            self.running_summary.add(snapshot)
+            self.trial_index.add(trial)
+            snapshots.append(snapshot)
+        if len(snapshots) > 0:
+            get_worker().submit(self.csv_writer.extend, snapshots)
+        self._journal("trials", (len(trials), snapshots))
+
+    @traced()
     def load(self) -> dict:
         """Load attributes of a previously saved object.
 
@@ -166,13 +249,22 @@ class SimpleProcedure(object):
                 `test_name`.
         """
         logger.debug("called load()")
+        get_worker().flush()
         dic = {}
+        stored = get_storage().load_procedure(self.proband_id, self.test_name)
 
-        if exists(self.path):
+        if stored is not None:
 
             logger.debug("data belonging to proband with this id already exists")
-            dic.update(load(open(self.path, "rb")))
+            self._has_snapshot = True
+            dic.update(stored)
             dic["last_loaded"] = datetime.now()
+            self._replay(dic)
+            logger.debug(
+                "loaded data with %s completed and %s remaining trials",
+                len(dic["completed_trials"]),
+                len(dic["remaining_trials"]),
+            )
 
             if dic["test_started"] is True and dic["test_completed"] is False:
 
@@ -184,21 +276,105 @@ class SimpleProcedure(object):
             logger.debug("data not found on disk")
             dic["created"] = datetime.now()
 
-        logger.debug(f"loaded data looks like this: {dic}")
         return dic
 
+    def _replay(self, dic: dict) -> None:
+        """Apply journal records newer than the snapshot `dic` to it, in place."""
+        logger.debug("called _replay()")
+        n = 0
+        for seq, kind, payload in self.journal.read(dic.get("journal_seq", 0)):
+            if kind == "trials":
+                n_finished, trials = payload
+                del dic["remaining_trials"][:n_finished]
+                dic["completed_trials"].extend(trials)
+                dic["test_started"] = True
+            elif kind == "skip":
+                self._skip(dic["remaining_trials"], *payload)
+            elif kind == "block":
+                dic.setdefault("block_events", []).append(payload)
+            dic["journal_seq"] = seq
+            n += 1
+        if n > 0:
+            logger.warning("replayed %s journal records", n)
+            dic["test_completed"] = all(
+                [len(dic["remaining_trials"]) == 0, len(dic["completed_trials"]) > 0]
+            )
+
+    def _running_summary(self) -> RunningSummary:
+        """Restore the stored running summary, or rebuild it from the completed trials
+        if it is missing, out of date (e.g., after replaying the journal), or was kept
+        for different groups."""
+        state = self.data["running_summary"]
+        groups = self.data["summary_groups"]
+        trials = self.data["completed_trials"]
+        if state is not None and state["n"] == len(trials):
+            running_summary = RunningSummary.from_state(state)
+            if running_summary.groups == RunningSummary(groups).groups:
+                return running_summary
+        logger.debug("rebuilding running summary from %s trials", len(trials))
+        running_summary = RunningSummary(groups)
+        running_summary.extend(trials)
+        return running_summary
+
+    def _journal(self, kind: str, payload: object) -> None:
+        """Append a record to the journal. Don't do this if proband ID is TEST.
+
+        If no snapshot has been saved yet, a snapshot (which already contains the
+        change being recorded) is saved instead.
+
+        """
+        if self.proband_id.upper() in forbidden_ids:
+            return
+        if not self._has_snapshot:
+            logger.debug("saving a snapshot for the journal to build on")
+            self.save()
+            return
+        get_worker().submit(self.journal.append, kind, payload)
+
+    @traced()
     def save(self) -> None:
-        """Dump the data. Don't do this if proband ID is TEST."""
+        """Dump the data. Don't do this if proband ID is TEST.
+
+        The storage backend writes the snapshot atomically, so a crash while saving
+        never leaves half-written data behind. Once the snapshot is safely on disk, the
+        journal is truncated.
+
+        """
         logger.debug("called save()")
         if self.proband_id.upper() not in forbidden_ids:
             self.backup()
-            logger.debug(f"saving these data: {self.data}")
+            logger.debug(
+                "saving data with %s completed and %s remaining trials",
+                len(self.data["completed_trials"]),
+                len(self.data["remaining_trials"]),
+            )
             self.data["last_saved"] = datetime.now()
-            dump(self.data, open(self.path, "wb"))
+            get_worker().submit(self._checkpoint, self._snapshot())
+            self._has_snapshot = True
         else:
             logger.debug("not saving the data: forbidden ID")
         self.update()
 
+    def _snapshot(self) -> dict:
+        """Returns a copy of the data that is safe to hand to the persistence worker.
+
+        Completed trials are never modified again, so only the lists containing them
+        are copied. Remaining trials may still be marked as skipped, so they are copied
+        too.
+
+        """
+        dic = {k: copy(v) for k, v in self.data.items()}
+        dic["remaining_trials"] = [dict(t) for t in self.data["remaining_trials"]]
+        dic["running_summary"] = self.running_summary.state()
+        return dic
+
+    @traced()
+    def _checkpoint(self, snapshot: dict) -> None:
+        """Store a snapshot and truncate the journal. Runs on the worker."""
+        snapshot["journal_seq"] = self.journal.seq
+        get_storage().save_procedure(snapshot)
+        self.journal.truncate()
+
     def update(self) -> None:
         """Updates the attributes according to the internal dictionary."""
         logger.debug("called update()")
@@ -213,14 +389,8 @@ class SimpleProcedure(object):
             reason: Reason for skipping.
 
         """
-        trials = self.data["remaining_trials"]
-        if all("block_number" in t for t in trials):
-            trials = [t for t in trials if t["block_number"] == b]
-            for t in trials:
-                t["status"] = "skipped"
-                t["reason_skipped"] = reason
-        else:
-            self.skip_all(reason)
+        self._skip(self.data["remaining_trials"], b, reason)
+        self._journal("skip", (b, reason))
 
     def skip_all(self, reason: str) -> None:
         """Label all trials as skipped.
@@ -228,18 +398,52 @@ class SimpleProcedure(object):
         Args:
             reason (str): Reason for skipping
         """
-        for t in self.data["remaining_trials"]:
+        self._skip(self.data["remaining_trials"], None, reason)
+        self._journal("skip", (None, reason))
+
+    @staticmethod
+    def _skip(trials: List[dict], b: Union[None, int], reason: str) -> None:
+        """Label trials in block `b`, or all trials if `b` is None, as skipped."""
+        if b is not None and all("block_number" in t for t in trials):
+            trials = [t for t in trials if t["block_number"] == b]
+        for t in trials:
             t["status"] = "skipped"
             t["reason_skipped"] = reason
 
+    def start_block(self, b: int) -> None:
+        """Record the start of a new block.
+
+        Args:
+            b (int): Block number.
+
+        """
+        event = (b, datetime.now())
+        self.data["block_events"].append(event)
+        self._journal("block", event)
+        get_worker().submit(self.journal.sync)
+
+    @traced()
     def to_csv(self) -> None:
-        """Write all trials to a csv."""
-        trials = self.data["completed_trials"]
-        pd.DataFrame(trials).dropna(axis=1, how="all").to_csv(self.csv, index=False)
+        """Write all trials to a csv.
+
+        This rewrites the whole file. During a test, trials are instead streamed to the
+        csv one at a time by `csv_writer`.
+
+        """
+        trials = list(self.data["completed_trials"])
+        get_worker().submit(write_csv, self.csv, trials)
+
+    def close(self) -> None:
+        """Close the journal and the streamed csv, leaving the canonical csv on disk."""
+        logger.debug("called close()")
+        get_worker().submit(self.journal.close)
+        get_worker().submit(self.csv_writer.close)
 
+    @traced()
     def save_summary(self) -> None:
         """Save the summary as a csv"""
-        pd.Series(self.data["summary"]).to_csv(self.data["summary_path"])
+        summary = pd.Series(self.data["summary"])
+        get_worker().submit(summary.to_csv, self.data["summary_path"])
 
     def backup(self) -> None:
         """Make a backup."""
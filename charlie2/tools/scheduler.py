@@ -0,0 +1,129 @@
+"""Defines timelines for running timed sequences of events without blocking.
+
+"""
+from logging import getLogger
+from typing import Callable, List, Tuple, Union
+
+from PyQt5.QtCore import QObject, Qt, QTimer
+
+from .timing import Clock, get_clock
+
+logger = getLogger(__name__)
+
+
+class Timeline(QObject):
+    def __init__(self, name: str = "timeline", clock: Clock = None) -> None:
+        """Timeline of phases.
+
+        Tests often need timed sequences of events, such as "show the study array for
+        3000 ms, then a blank screen for 2000 ms, then the response array". Pausing by
+        running a nested event loop (the old `sleep` method) means everything after the
+        pause runs inside that loop, so timers and input events can re-enter the test at
+        awkward moments and the app cannot close cleanly until the loop exits. Instead,
+        a timeline is a list of phases declared in advance with `then`, and `start`
+        runs them from the main event loop: each phase calls its action and then a
+        single-shot timer schedules the next phase.
+
+        Phase deadlines are absolute, measured from when the timeline was started, so
+        if one phase runs late (e.g., because painting a stimulus took a while) the
+        next phase is shortened to compensate and the delay does not accumulate. The
+        achieved duration of each phase is logged and kept in `achieved`.
+
+        Cleaning up after a timeline which is cancelled before it finishes (e.g.,
+        releasing a label that its last phase would have removed) can be added with
+        `on_cancel`.
+
+        Args:
+            name (:obj:`str`, optional): Name used when logging.
+            clock (:obj:`Clock`, optional): Clock from which to take times.
+
+        """
+        super(Timeline, self).__init__()
+        self.name = name
+        self.clock = get_clock() if clock is None else clock
+        self.phases: List[Tuple[str, Union[Callable, None], int]] = []
+        self.cancel_actions: List[Callable] = []
+        self.achieved: List[Tuple[str, int, float]] = []
+        self.running = False
+        self._index = -1
+        self._deadline_ns = 0
+        self._phase_started_ns = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._advance)
+
+    def then(
+        self, action: Callable = None, ms: int = 0, name: str = None
+    ) -> "Timeline":
+        """Add a phase which calls `action` and then lasts for `ms` milliseconds.
+
+        Args:
+            action (:obj:`callable`, optional): Called with no arguments when the phase
+                starts.
+            ms (:obj:`int`, optional): Duration of the phase.
+            name (:obj:`str`, optional): Name of the phase, used when logging.
+
+        Returns:
+            Timeline: This timeline, so calls can be chained.
+
+        """
+        if name is None:
+            name = f"phase {len(self.phases)}"
+        self.phases.append((name, action, ms))
+        return self
+
+    def on_cancel(self, action: Callable) -> "Timeline":
+        """Add an action to call if the timeline is cancelled while running.
+
+        Args:
+            action (callable): Called with no arguments.
+
+        Returns:
+            Timeline: This timeline, so calls can be chained.
+
+        """
+        self.cancel_actions.append(action)
+        return self
+
+    def start(self) -> "Timeline":
+        """Start running the phases. The first phase starts immediately."""
+        logger.debug("starting %s with %s phases", self.name, len(self.phases))
+        self.running = True
+        self.achieved = []
+        self._index = -1
+        self._deadline_ns = self.clock.now_ns()
+        self._advance()
+        return self
+
+    def cancel(self) -> None:
+        """Stop running the phases. Safe to call from within an action."""
+        was_running = self.running
+        self.running = False
+        self._timer.stop()
+        if was_running:
+            logger.debug("cancelled %s during phase %s", self.name, self._index)
+            for action in self.cancel_actions:
+                action()
+
+    def _advance(self) -> None:
+        now = self.clock.now_ns()
+        if self._index >= 0:
+            name, _, ms = self.phases[self._index]
+            achieved = (now - self._phase_started_ns) / 1e6
+            self.achieved.append((name, ms, achieved))
+            logger.debug(
+                "%s: %s lasted %.3f ms (requested %s ms)", self.name, name, achieved, ms
+            )
+        self._index += 1
+        if self._index == len(self.phases):
+            self.running = False
+            return
+        name, action, ms = self.phases[self._index]
+        self._phase_started_ns = now
+        self._deadline_ns += ms * 1000 * 1000
+        if action is not None:
+            action()
+        if self.running:
+            wait = (self._deadline_ns - self.clock.now_ns()) / 1e6
+            self._timer.start(max(0, round(wait)))
@@ -0,0 +1,79 @@
+"""Defines tools for measuring how long the app takes to start.
+
+Import this module before anything else, so that `started` is as close as possible to
+the start of the process. Run it as a script to see which modules take longest to
+import:
+
+    python -m charlie2.tools.startup
+
+"""
+from argparse import ArgumentParser
+from logging import getLogger
+from os.path import dirname
+from re import compile
+from subprocess import run
+from sys import executable
+from time import perf_counter
+from typing import List, Tuple
+
+logger = getLogger(__name__)
+started = perf_counter()
+startup_budget_ms = 1500
+_importtime = compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def report_startup() -> float:
+    """Log how long it took to put the GUI on screen, warning if over budget.
+
+    Call this once the main window has been shown and the event loop is running.
+
+    Returns:
+        float: Milliseconds since this module was imported.
+
+    """
+    ms = (perf_counter() - started) * 1000
+    log = logger.warning if ms > startup_budget_ms else logger.info
+    log("GUI took %.0f ms to start (budget %s ms)", ms, startup_budget_ms)
+    return ms
+
+
+def profile_imports(module: str = "charlie2.tools.app") -> List[Tuple[str, int, int]]:
+    """Import a module in a fresh interpreter and time the import of every module.
+
+    Uses Python's `-X importtime` option, so times are not affected by modules which
+    the current process has already imported.
+
+    Args:
+        module (:obj:`str`, optional): Module to import.
+
+    Returns:
+        list: Tuples of module name, self time, and cumulative time (in microseconds)
+            in the order the imports finished.
+
+    """
+    cwd = dirname(dirname(dirname(__file__)))
+    cmd = [executable, "-X", "importtime", "-c", f"import {module}"]
+    result = run(cmd, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _importtime.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Report import times of the app's modules.")
+    parser.add_argument("-m", "--module", default="charlie2.tools.app")
+    parser.add_argument("-n", "--top", type=int, default=20)
+    args = parser.parse_args()
+    rows = profile_imports(args.module)
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[1])[: args.top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
+    total = rows[-1][2] / 1000
+    print(f"importing {args.module} took {total:.0f} ms", end=" ")
+    print(f"(the whole GUI must start within {startup_budget_ms} ms)")
@@ -1,91 +1,190 @@
 """Defines functions for calculating various summary statistics.
 
+During a test, `RunningSummary` keeps the statistics up to date one trial at a time,
+so they are available to stopping rules and at the end of the test without rescanning
+any trials.
 
 """
 from logging import getLogger
-from typing import List
+from typing import Dict, Iterable
 
 logger = getLogger(__name__)
 
 
-def basic_summary(
-    trials: List[dict], prefix: str = "", adjust: bool = False, no_practice: bool = True
-) -> dict:
-    """Returns an basic set of summary statistics.
-
-    Args:
-        trials (:obj:`list` of :obj:`dict` objects): List of trials to analyse. Each
-            trial is a dictionary.
-        prefix (:obj:`str`, optional): Prefix to prepend to statistic names. If empty
-            (default), no prefix is prepended.
-        adjust (:obj:`bool`, optional): Calculated "adjusted" time taken if not all
-            trials were completed before a timeout event. Defaults to `False`.
-        no_practice (:obj:`bool`, optional): Include practice trials in summary. Default
-            is `False`. I don't see any reason to ever change this.
-
-    Returns:
-        dict: dictionary of results.
-
-    """
-    logger.debug("called basic_summary()")
-
-    if len(trials) == 0:
-        return {}
-
-    # filter out practice trials
-    if no_practice is True:
-        trials_ = [t for t in trials if t["practice"] is False]
-    else:
-        trials_ = trials
-
-    # check all trials are either "completed" or "skipped"
-    completed_trials = [t for t in trials_ if t["status"] == "completed"]
-    skipped_trials = [t for t in trials_ if t["status"] == "skipped"]
-    n = len(completed_trials) + len(skipped_trials)
-    if n != len(trials_):
-        logger.warning("some trials have a status other than 'completed' or 'skipped'")
-
-    # create dictionary
-    dic = {
-        "total_trials": len(trials_),
-        "completed_trials": len(completed_trials),
-        "skipped_trials": len(skipped_trials),
-        "completed_or_skipped_trials": n,
-        "correct_trials": len([t for t in trials_ if t["correct"] is True]),
-    }
-
-    # reaction time
-    correct_trials = [t for t in trials_ if t["correct"] is True]
-    if len(correct_trials) > 0:
-        rts = [t["trial_time_elapsed_ms"] for t in correct_trials]
-        dic["mean_rt_correct_ms"] = sum(rts) / len(rts)
-
-    # times
-    dic["started_timestamp"] = trials[0]["started_timestamp"]
-    dic["finished_timestamp"] = trials[-1]["finished_timestamp"]
-    dic["total_time_taken"] = dic["finished_timestamp"] - dic["started_timestamp"]
-
-    if len(completed_trials) > 0:
-        dic["block_duration_ms"] = completed_trials[-1]["block_time_elapsed_ms"]
-
-    # adjusted block duration
-    if adjust is True and len(correct_trials) > 0:
-        extra_time = dic["mean_rt_correct_ms"] * len(skipped_trials)
-        dic["block_duration_ms_adjusted"] = dic["block_duration_ms"] + extra_time
-
-    # accuracy
-    try:
-        dic["accuracy"] = len(correct_trials) / len(trials_)
-    except ZeroDivisionError:
-        dic["accuracy"] = 0
-
-        # format prefix
-    if prefix != "":
-        p = f"{prefix}_"
-    else:
-        p = ""
-
-    # prepend prefix
-    dic = {p + k: v for k, v in dic.items()}
-
-    return dic
+class RunningSummary(object):
+    def __init__(self, groups: Dict[str, Dict[str, Iterable]] = None) -> None:
+        """Incremental summary statistics.
+
+        Rather than scanning all completed trials at the end of a test, a running
+        summary is updated by `add` as each trial is completed, in constant time. It
+        holds a set of accumulators for each group of trials. A group is defined by a
+        dictionary of conditions mapping trial keys to allowed values; a trial belongs
+        to every group whose conditions it meets, so groups may overlap. The group named
+        "" contains all trials unless given conditions of its own.
+
+        The accumulators give the basic summary statistics (numbers of trials, mean
+        correct reaction time, block duration, and accuracy; see `summary`), plus the
+        running variance of correct reaction times, the total attempts and errors on
+        correct trials, and the total valid and invalid responses. They are plain
+        dictionaries, so a running summary can be pickled with its procedure via
+        `state` and restored via `from_state`.
+
+        Args:
+            groups (:obj:`dict`, optional): Maps group names to conditions.
+
+        """
+        self.groups = {"": {}, **(groups or {})}
+        self.n = 0
+        self.accumulators = {g: self._new() for g in self.groups}
+
+    @staticmethod
+    def _new() -> dict:
+        return {
+            "n": 0,
+            "total": 0,
+            "completed": 0,
+            "skipped": 0,
+            "correct": 0,
+            "correct_all": 0,
+            "rt_n": 0,
+            "rt_sum": 0,
+            "rt_mean": 0.0,
+            "rt_m2": 0.0,
+            "started_timestamp": None,
+            "finished_timestamp": None,
+            "block_duration_ms": None,
+            "attempts": 0,
+            "errors": 0,
+            "valid_responses": 0,
+            "invalid_responses": 0,
+        }
+
+    def state(self) -> dict:
+        """Returns a copy of the state that can be stored with the procedure."""
+        return {
+            "groups": dict(self.groups),
+            "n": self.n,
+            "accumulators": {g: dict(a) for g, a in self.accumulators.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RunningSummary":
+        """Restore a running summary from a stored state."""
+        obj = cls(state["groups"])
+        obj.n = state["n"]
+        obj.accumulators = {g: dict(a) for g, a in state["accumulators"].items()}
+        return obj
+
+    def _member(self, trial: dict, conditions: Dict[str, Iterable]) -> bool:
+        return all(trial.get(k) in v for k, v in conditions.items())
+
+    def add(self, trial: dict) -> None:
+        """Update the accumulators of every group the completed trial belongs to."""
+        self.n += 1
+        included = trial["practice"] is False
+        correct = trial["correct"] is True
+        for g, conditions in self.groups.items():
+            if not self._member(trial, conditions):
+                continue
+            a = self.accumulators[g]
+            a["n"] += 1
+            if a["started_timestamp"] is None:
+                a["started_timestamp"] = trial["started_timestamp"]
+            a["finished_timestamp"] = trial["finished_timestamp"]
+            a["valid_responses"] += trial.get("valid_responses", 0)
+            a["invalid_responses"] += trial.get("invalid_responses", 0)
+            if correct:
+                a["correct_all"] += 1
+                a["attempts"] += trial.get("attempts", 0)
+                a["errors"] += trial.get("errors", 0)
+            if not included:
+                continue
+            a["total"] += 1
+            if trial["status"] == "completed":
+                a["completed"] += 1
+                if trial.get("block_time_elapsed_ms") is not None:
+                    a["block_duration_ms"] = trial["block_time_elapsed_ms"]
+            elif trial["status"] == "skipped":
+                a["skipped"] += 1
+            if correct:
+                a["correct"] += 1
+                rt = trial.get("trial_time_elapsed_ms")
+                if rt is None:
+                    logger.warning("correct trial has no reaction time: %s", trial)
+                    continue
+                a["rt_n"] += 1
+                a["rt_sum"] += rt
+                delta = rt - a["rt_mean"]
+                a["rt_mean"] += delta / a["rt_n"]
+                a["rt_m2"] += delta * (rt - a["rt_mean"])
+
+    def extend(self, trials: Iterable[dict]) -> None:
+        """Add several completed trials."""
+        for trial in trials:
+            self.add(trial)
+
+    def group(self, name: str = "") -> dict:
+        """Returns the accumulators of a group."""
+        return self.accumulators[name]
+
+    def summary(self, name: str = "", prefix: str = None, adjust: bool = False) -> dict:
+        """Returns the basic summary statistics for a group of trials.
+
+        Args:
+            name (:obj:`str`, optional): Name of the group. Default is all trials.
+            prefix (:obj:`str`, optional): Prefix to prepend to statistic names.
+                Defaults to the name of the group.
+            adjust (:obj:`bool`, optional): Calculate "adjusted" time taken.
+
+        Returns:
+            dict: dictionary of results.
+
+        """
+        a = self.accumulators[name]
+        if a["n"] == 0:
+            return {}
+        n = a["completed"] + a["skipped"]
+        dic = {
+            "total_trials": a["total"],
+            "completed_trials": a["completed"],
+            "skipped_trials": a["skipped"],
+            "completed_or_skipped_trials": n,
+            "correct_trials": a["correct"],
+        }
+        if a["rt_n"] > 0:
+            dic["mean_rt_correct_ms"] = a["rt_sum"] / a["rt_n"]
+        dic["started_timestamp"] = a["started_timestamp"]
+        dic["finished_timestamp"] = a["finished_timestamp"]
+        dic["total_time_taken"] = dic["finished_timestamp"] - dic["started_timestamp"]
+        if a["completed"] > 0:
+            dic["block_duration_ms"] = a["block_duration_ms"]
+        if adjust is True and a["rt_n"] > 0 and a["block_duration_ms"] is not None:
+            extra_time = dic["mean_rt_correct_ms"] * a["skipped"]
+            dic["block_duration_ms_adjusted"] = dic["block_duration_ms"] + extra_time
+        try:
+            dic["accuracy"] = a["correct"] / a["total"]
+        except ZeroDivisionError:
+            dic["accuracy"] = 0
+        prefix = name if prefix is None else prefix
+        p = f"{prefix}_" if prefix != "" else ""
+        return {p + k: v for k, v in dic.items()}
+
+    def live(self, name: str = "") -> dict:
+        """Returns a few figures for monitoring performance while a test is running.
+
+        Args:
+            name (:obj:`str`, optional): Name of the group. Default is all trials.
+
+        Returns:
+            dict: Number of trials, accuracy, and the mean and standard deviation of
+                correct reaction times (None if not available).
+
+        """
+        a = self.accumulators[name]
+        k = a["rt_n"]
+        return {
+            "trials": a["total"],
+            "accuracy": a["correct"] / a["total"] if a["total"] > 0 else None,
+            "mean_rt_ms": a["rt_mean"] if k > 0 else None,
+            "sd_rt_ms": (a["rt_m2"] / (k - 1)) ** 0.5 if k > 1 else None,
+        }
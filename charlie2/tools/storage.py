@@ -0,0 +1,542 @@
+"""Defines storage backends for proband and procedure data.
+
+Two backends are available. `PickleStorage` is the original layout: one pickled
+dictionary per proband and per procedure under `data/current`. `SQLiteStorage` keeps
+everything in a single indexed SQLite database, so listing probands or checking the
+status of a test does not require opening and unpickling many files.
+
+Both backends can answer questions about the status of a procedure (whether it was
+started or completed, how many trials it has, etc.) via `status`, without loading any
+trials.
+
+The SQLite backend is used automatically once the database exists. To create it from an
+existing `data/current` tree, run::
+
+    python -m charlie2.tools.storage
+
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from logging import getLogger
+from os import fsync, listdir, makedirs, remove, replace
+from os.path import dirname, exists, getmtime, getsize
+from os.path import join as pj
+from pickle import HIGHEST_PROTOCOL, dump, dumps, load, loads
+from sqlite3 import connect
+from threading import Lock
+from typing import Iterator, List, Tuple, Union
+
+from .journal import Journal
+from .paths import current_data_path, database_path, test_data_path, tests_list
+
+logger = getLogger(__name__)
+_trial_lists = ("completed_trials", "remaining_trials")
+_storage = None
+schema_version = 1
+
+
+class PickleStorage(object):
+    def __init__(self, root: str = current_data_path) -> None:
+        """Legacy storage backend.
+
+        Probands are stored as `probands/<proband_id>.pkl` and procedures as
+        `tests/<proband_id>_<test_name>.pkl`.
+
+        A small status index, `tests/.status_index.pkl`, records the status of every
+        procedure along with the modification time of its file. It is updated whenever
+        a procedure is saved. If a file's modification time no longer matches the index
+        (e.g., because it was edited or copied in outside the app), that file alone is
+        unpickled to refresh its entry in memory. The index file itself is only
+        rewritten once per save, rebuild or close, however many entries were refreshed.
+
+        Args:
+            root (:obj:`str`, optional): The `data/current` directory.
+
+        """
+        logger.debug("initialised %s with root=%s", type(self), root)
+        self.proband_path = pj(root, "probands")
+        self.test_data_path = pj(root, "tests")
+        self.index_path = pj(self.test_data_path, ".status_index.pkl")
+        self._lock = Lock()
+        self._probands = (None, [])
+        self._dirty = False
+        try:
+            self._index = self._load(self.index_path) or {}
+        except Exception:
+            logger.warning("status index is unreadable, so starting a new one")
+            self._index = {}
+
+    def _proband_file(self, proband_id: str) -> str:
+        return pj(self.proband_path, f"{proband_id}.pkl")
+
+    def _procedure_file(self, proband_id: str, test_name: str) -> str:
+        return pj(self.test_data_path, f"{proband_id}_{test_name}.pkl")
+
+    @staticmethod
+    def _dump(data: dict, path: str) -> None:
+        """Pickle `data` to a temporary file, then move it into place."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            dump(data, f)
+            f.flush()
+            fsync(f.fileno())
+        replace(tmp, path)
+
+    @staticmethod
+    def _load(path: str) -> Union[None, dict]:
+        if exists(path):
+            with open(path, "rb") as f:
+                return load(f)
+
+    def proband_ids(self) -> List[str]:
+        """Returns a sorted list of proband IDs.
+
+        The directory is only listed again if its modification time has changed.
+
+        """
+        mtime = getmtime(self.proband_path)
+        if mtime != self._probands[0]:
+            ls = listdir(self.proband_path)
+            ids = sorted(p.replace(".pkl", "") for p in ls if p.endswith(".pkl"))
+            self._probands = (mtime, ids)
+        return list(self._probands[1])
+
+    def load_proband(self, proband_id: str) -> Union[None, dict]:
+        """Returns the stored data for a proband, or None if there are none."""
+        return self._load(self._proband_file(proband_id))
+
+    def save_proband(self, data: dict) -> None:
+        """Store the data for a proband."""
+        self._dump(data, self._proband_file(data["proband_id"]))
+
+    def delete_proband(self, proband_id: str) -> None:
+        """Delete a proband, but not their procedures."""
+        path = self._proband_file(proband_id)
+        if exists(path):
+            remove(path)
+
+    def procedure_exists(self, proband_id: str, test_name: str) -> bool:
+        """Returns True if data for this proband and test are stored."""
+        return exists(self._procedure_file(proband_id, test_name))
+
+    def load_procedure(self, proband_id: str, test_name: str) -> Union[None, dict]:
+        """Returns the stored data for a procedure, or None if there are none."""
+        return self._load(self._procedure_file(proband_id, test_name))
+
+    def save_procedure(self, data: dict) -> None:
+        """Store the data for a procedure."""
+        key = (data["proband_id"], data["test_name"])
+        path = self._procedure_file(*key)
+        self._dump(data, path)
+        self._update_index(key, data, path)
+        self.save_index()
+
+    def status(self, proband_id: str, test_name: str) -> Union[None, dict]:
+        """Returns the status of a procedure, or None if there are no data.
+
+        See `procedure_status` for the contents of the returned dictionary, which also
+        counts trials recorded in the journal since the last save (see
+        `journal_status`).
+
+        """
+        key = (proband_id, test_name)
+        path = self._procedure_file(*key)
+        try:
+            mtime = getmtime(path)
+        except FileNotFoundError:
+            with self._lock:
+                if self._index.pop(key, None) is not None:
+                    self._dirty = True
+            return None
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is None or entry["mtime"] != mtime:
+            logger.debug("status index is stale for %s", path)
+            entry = self._update_index(key, self._load(path), path)
+        return journal_status(entry, *key)
+
+    def _update_index(self, key: Tuple[str, str], data: dict, path: str) -> dict:
+        """Record the status of a procedure in the index, without saving the index."""
+        entry = procedure_status(data)
+        entry["mtime"] = getmtime(path)
+        with self._lock:
+            self._index[key] = entry
+            self._dirty = True
+        return entry
+
+    def save_index(self) -> None:
+        """Write the status index to disk, if it has changed."""
+        with self._lock:
+            if self._dirty:
+                self._dump(self._index, self.index_path)
+                self._dirty = False
+
+    def rebuild_index(self) -> None:
+        """Bring the whole status index up to date with the files on disk."""
+        logger.debug("rebuilding status index")
+        keys = set(self.procedures())
+        with self._lock:
+            for key in set(self._index) - keys:
+                del self._index[key]
+                self._dirty = True
+        for key in keys:
+            self.status(*key)
+        self.save_index()
+
+    def procedures(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over the proband IDs and test names of all stored procedures."""
+        for f in sorted(listdir(self.test_data_path)):
+            for test_name in tests_list:
+                if f.endswith(f"_{test_name}.pkl"):
+                    yield f[: -len(f"_{test_name}.pkl")], test_name
+
+    def close(self) -> None:
+        self.save_index()
+
+
+class SQLiteStorage(object):
+    def __init__(self, path: str = database_path) -> None:
+        """SQLite storage backend.
+
+        Probands, procedures and trials each have their own table. Each trial is a
+        separate row, so saving a procedure only needs to pickle trials that have been
+        completed since the last save, plus the (usually short) list of remaining
+        trials. Procedures also store their status and trial counts in plain columns, so
+        these can be queried without unpickling anything.
+
+        The database is opened in WAL mode, and every save happens within a single
+        transaction. Its schema version is kept in `PRAGMA user_version`, and databases
+        with an older schema are migrated when they are opened.
+
+        Args:
+            path (:obj:`str`, optional): Path to the database file.
+
+        """
+        logger.debug("initialised %s with path=%s", type(self), path)
+        makedirs(dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = Lock()
+        self._conn = connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS probands (
+                    proband_id TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    last_saved TEXT
+                );
+                CREATE TABLE IF NOT EXISTS procedures (
+                    proband_id TEXT NOT NULL,
+                    test_name TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    test_started INTEGER NOT NULL,
+                    test_completed INTEGER NOT NULL,
+                    n_completed INTEGER NOT NULL,
+                    n_remaining INTEGER NOT NULL,
+                    last_saved TEXT,
+                    status BLOB NOT NULL,
+                    PRIMARY KEY (proband_id, test_name)
+                );
+                CREATE INDEX IF NOT EXISTS procedures_by_test
+                    ON procedures (test_name, proband_id);
+                CREATE TABLE IF NOT EXISTS trials (
+                    proband_id TEXT NOT NULL,
+                    test_name TEXT NOT NULL,
+                    list TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (proband_id, test_name, list, position)
+                );
+                """
+            )
+            self._migrate()
+
+    def _migrate(self) -> None:
+        """Bring the schema of an existing database up to date."""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            columns = [
+                r[1] for r in self._conn.execute("PRAGMA table_info(procedures)")
+            ]
+            if "status" not in columns:
+                logger.info("adding status column to procedures in %s", self.path)
+                self._conn.execute("ALTER TABLE procedures ADD COLUMN status BLOB")
+                rows = self._conn.execute(
+                    "SELECT proband_id, test_name, data, n_completed, n_remaining "
+                    "FROM procedures"
+                ).fetchall()
+                for proband_id, test_name, data, n_completed, n_remaining in rows:
+                    status = procedure_status(loads(data))
+                    status.update(n_completed=n_completed, n_remaining=n_remaining)
+                    self._conn.execute(
+                        "UPDATE procedures SET status = ? "
+                        "WHERE proband_id = ? AND test_name = ?",
+                        (dumps(status, HIGHEST_PROTOCOL), proband_id, test_name),
+                    )
+        if version < schema_version:
+            self._conn.execute(f"PRAGMA user_version = {schema_version}")
+
+    def proband_ids(self) -> List[str]:
+        """Returns a sorted list of proband IDs."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT proband_id FROM probands ORDER BY proband_id"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def load_proband(self, proband_id: str) -> Union[None, dict]:
+        """Returns the stored data for a proband, or None if there are none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM probands WHERE proband_id = ?", (proband_id,)
+            ).fetchone()
+        return None if row is None else loads(row[0])
+
+    def save_proband(self, data: dict) -> None:
+        """Store the data for a proband."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probands VALUES (?, ?, ?)",
+                (data["proband_id"], dumps(data, HIGHEST_PROTOCOL), _now()),
+            )
+
+    def delete_proband(self, proband_id: str) -> None:
+        """Delete a proband, but not their procedures."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM probands WHERE proband_id = ?", (proband_id,)
+            )
+
+    def procedure_exists(self, proband_id: str, test_name: str) -> bool:
+        """Returns True if data for this proband and test are stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM procedures WHERE proband_id = ? AND test_name = ?",
+                (proband_id, test_name),
+            ).fetchone()
+        return row is not None
+
+    def load_procedure(self, proband_id: str, test_name: str) -> Union[None, dict]:
+        """Returns the stored data for a procedure, or None if there are none."""
+        key = (proband_id, test_name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM procedures WHERE proband_id = ? AND test_name = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            data = loads(row[0])
+            for name in _trial_lists:
+                rows = self._conn.execute(
+                    "SELECT data FROM trials WHERE proband_id = ? AND test_name = ? "
+                    "AND list = ? ORDER BY position",
+                    key + (name,),
+                )
+                data[name] = [loads(r[0]) for r in rows]
+        return data
+
+    def save_procedure(self, data: dict) -> None:
+        """Store the data for a procedure.
+
+        Completed trials only ever grow during a test, so only those beyond the number
+        already stored are inserted. Remaining trials are replaced wholesale.
+
+        """
+        key = (data["proband_id"], data["test_name"])
+        completed = data["completed_trials"]
+        remaining = data["remaining_trials"]
+        rest = {k: v for k, v in data.items() if k not in _trial_lists}
+        with self._lock, self._conn:
+            c = self._conn
+            n = c.execute(
+                "SELECT COUNT(*) FROM trials WHERE proband_id = ? AND test_name = ? "
+                "AND list = 'completed_trials'",
+                key,
+            ).fetchone()[0]
+            if n > len(completed):
+                c.execute(
+                    "DELETE FROM trials WHERE proband_id = ? AND test_name = ? "
+                    "AND list = 'completed_trials'",
+                    key,
+                )
+                n = 0
+            c.execute(
+                "DELETE FROM trials WHERE proband_id = ? AND test_name = ? "
+                "AND list = 'remaining_trials'",
+                key,
+            )
+            c.executemany(
+                "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?)",
+                [
+                    key + ("completed_trials", i, dumps(completed[i], HIGHEST_PROTOCOL))
+                    for i in range(n, len(completed))
+                ]
+                + [
+                    key + ("remaining_trials", i, dumps(t, HIGHEST_PROTOCOL))
+                    for i, t in enumerate(remaining)
+                ],
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO procedures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                key
+                + (
+                    dumps(rest, HIGHEST_PROTOCOL),
+                    bool(data.get("test_started")),
+                    bool(data.get("test_completed")),
+                    len(completed),
+                    len(remaining),
+                    _now(),
+                    dumps(procedure_status(data), HIGHEST_PROTOCOL),
+                ),
+            )
+
+    def status(self, proband_id: str, test_name: str) -> Union[None, dict]:
+        """Returns the status of a procedure, or None if there are no data.
+
+        See `procedure_status` for the contents of the returned dictionary, which also
+        counts trials recorded in the journal since the last save (see
+        `journal_status`).
+
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM procedures WHERE proband_id = ? AND test_name = ?",
+                (proband_id, test_name),
+            ).fetchone()
+        if row is None:
+            return None
+        return journal_status(loads(row[0]), proband_id, test_name)
+
+    def rebuild_index(self) -> None:
+        """The procedures table is the index, so there is nothing to do."""
+        pass
+
+    def procedures(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over the proband IDs and test names of all stored procedures."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT proband_id, test_name FROM procedures "
+                "ORDER BY proband_id, test_name"
+            ).fetchall()
+        yield from rows
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def procedure_status(data: dict) -> dict:
+    """Summarise the status of a procedure without keeping any of its trials.
+
+    Args:
+        data (dict): Procedure data.
+
+    Returns:
+        dict: Contains `status` (one of "started", "resumable" or "completed"),
+            `n_completed` and `n_remaining` (numbers of trials), the `created`,
+            `finished_timestamp` and `last_saved` timestamps, and `journal_seq`.
+
+    """
+    if data.get("test_completed"):
+        status = "completed"
+    elif data.get("test_started"):
+        status = "resumable"
+    else:
+        status = "started"
+    return {
+        "status": status,
+        "n_completed": len(data.get("completed_trials", [])),
+        "n_remaining": len(data.get("remaining_trials", [])),
+        "created": data.get("created"),
+        "finished_timestamp": data.get("finished_timestamp"),
+        "last_saved": data.get("last_saved"),
+        "journal_seq": data.get("journal_seq", 0),
+    }
+
+
+def journal_status(entry: dict, proband_id: str, test_name: str) -> dict:
+    """Bring a status up to date with the procedure's journal.
+
+    Trials recorded in the journal since the last snapshot (e.g., during a test that
+    crashed) are not in the stored status. The journal is only read if it is not
+    empty, which is rare outside of a running test.
+
+    Args:
+        entry (dict): Status, as from `procedure_status`.
+        proband_id (str): The proband ID.
+        test_name (str): The test name.
+
+    Returns:
+        dict: A copy of the status, including trials from the journal.
+
+    """
+    entry = dict(entry)
+    path = pj(test_data_path, f"{proband_id}_{test_name}.journal")
+    if not exists(path) or getsize(path) == 0:
+        return entry
+    n = 0
+    for _, kind, payload in Journal(path).read(entry.get("journal_seq", 0)):
+        if kind == "trials":
+            n_finished, trials = payload
+            entry["n_remaining"] = max(0, entry["n_remaining"] - n_finished)
+            entry["n_completed"] += len(trials)
+            n += 1
+    if n > 0:
+        logger.debug("status of %s includes %s journal records", path, n)
+        if entry["n_remaining"] == 0 and entry["n_completed"] > 0:
+            entry["status"] = "completed"
+        else:
+            entry["status"] = "resumable"
+    return entry
+
+
+def get_storage() -> Union[PickleStorage, SQLiteStorage]:
+    """Returns the storage backend shared by the whole app.
+
+    The SQLite backend is used if the database exists; otherwise the pickle backend.
+
+    """
+    global _storage
+    if _storage is None:
+        if exists(database_path):
+            _storage = SQLiteStorage()
+        else:
+            _storage = PickleStorage()
+        logger.debug("using storage backend %s", type(_storage))
+    return _storage
+
+
+def migrate(root: str = current_data_path, path: str = database_path) -> None:
+    """Import a `data/current` tree of pickles into a SQLite database.
+
+    Args:
+        root (:obj:`str`, optional): The `data/current` directory to import.
+        path (:obj:`str`, optional): Path to the database file.
+
+    """
+    logger.info("migrating %s to %s", root, path)
+    src = PickleStorage(root)
+    dst = SQLiteStorage(path)
+    for proband_id in src.proband_ids():
+        dst.save_proband(src.load_proband(proband_id))
+    for proband_id, test_name in src.procedures():
+        dst.save_procedure(src.load_procedure(proband_id, test_name))
+    dst.close()
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Import pickled data into a SQLite database.")
+    parser.add_argument(
+        "root", nargs="?", default=current_data_path, help="data/current directory."
+    )
+    parser.add_argument("-d", "--database", default=database_path, help="Database.")
+    args = parser.parse_args()
+    migrate(args.root, args.database)
@@ -2,7 +2,6 @@
 
 """
 from logging import getLogger
-from os.path import exists
 
 from PyQt5.QtWidgets import (
     QCheckBox,
@@ -23,7 +22,7 @@ from .paths import (
     proband_pickles,
     tests_list,
 )
-from .procedure import SimpleProcedure
+from .storage import get_storage
 
 logger = getLogger(__name__)
 
@@ -36,7 +35,7 @@ class TestsWidget(QWidget):
 
         """
         super(TestsWidget, self).__init__(parent=parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # instructions
         self.instructions = self.parent().instructions
@@ -172,10 +171,10 @@ class TestsWidget(QWidget):
 
     def _begin(self) -> None:
         logger.debug("called _begin()")
-        data = SimpleProcedure(
-            proband_id=self.kwds["proband_id"], test_name=self.kwds["test_names"][0]
+        status = get_storage().status(
+            self.kwds["proband_id"], self.kwds["test_names"][0]
         )
-        proband_exists = exists(data.path)
+        proband_exists = status is not None
         if proband_exists and not self.kwds["resumable"]:
             message_box = QMessageBox()
             msg = get_error_messages(self.kwds["language"], "proband_exists")
@@ -0,0 +1,147 @@
+"""Defines a high-resolution clock for timing stimuli and responses.
+
+"""
+from collections import Counter
+from logging import getLogger
+from typing import Union
+
+from PyQt5.QtCore import QElapsedTimer, QEvent, QObject, QTimer
+from PyQt5.QtGui import QInputEvent
+from PyQt5.QtWidgets import QWidget
+
+from .tracing import instant
+
+logger = getLogger(__name__)
+_clock = None
+max_input_latency_ns = 1000 * 1000 * 1000
+
+
+class Clock(object):
+    def __init__(self) -> None:
+        """Monotonic nanosecond clock.
+
+        `QTime.elapsed` only has millisecond resolution. Worse, reading it inside an
+        event handler measures when the event was handled, not when it happened, so
+        any delay in the event queue (e.g., while a repaint finishes) is added to the
+        response time. This clock is based on `QElapsedTimer`, which uses the
+        system's monotonic clock, and times are given in nanoseconds since the clock
+        was created.
+
+        Input events also carry a timestamp set when the window system generated them
+        (`QInputEvent.timestamp`), in milliseconds on the same monotonic clock on the
+        main platforms (X11, Wayland, Windows). `event_ns` converts these to the
+        timeline of this clock, so that the delay between an input event being
+        generated and handled can be measured and removed from response times.
+        Timestamps which are missing (e.g., synthetic events) or implausible (not
+        within a second before the event was handled) are ignored.
+
+        """
+        self._timer = QElapsedTimer()
+        self._timer.start()
+        self._reference_ms = self._timer.msecsSinceReference()
+        logger.debug(
+            "initialised %s with clock type %s", type(self), self._timer.clockType()
+        )
+
+    def now_ns(self) -> int:
+        """Returns the current time in nanoseconds."""
+        return self._timer.nsecsElapsed()
+
+    def event_ns(self, event: QInputEvent, handled_ns: int) -> Union[int, None]:
+        """Returns the time an input event was generated, if known.
+
+        Event timestamps have millisecond resolution, and so do the results.
+
+        Args:
+            event (QInputEvent): A mouse, touch, or key event.
+            handled_ns (int): Time (from `now_ns`) when the event was handled.
+
+        Returns:
+            :obj:`int` or :obj:`None`: Time in nanoseconds, or None.
+
+        """
+        timestamp = event.timestamp()
+        if not timestamp:
+            return None
+        ns = (timestamp - self._reference_ms) * 1000 * 1000
+        if 0 <= handled_ns - ns <= max_input_latency_ns:
+            return ns
+        logger.debug("ignoring implausible event timestamp %s", timestamp)
+        return None
+
+
+class FrameMonitor(QObject):
+    def __init__(self, widget: QWidget, clock: Clock) -> None:
+        """Measures when stimuli reach the screen.
+
+        Showing a widget or changing a pixmap only schedules a repaint; the new frame is
+        drawn and handed to the window system some time later, once control returns to
+        the event loop. Call `expect` whenever something is displayed. The monitor
+        watches the paint events of `widget` and the update requests of its window, and
+        once a frame has been painted, records the time the event loop next regains
+        control, i.e., after the frame has been flushed to the window system. This is
+        the closest observable point to the frame reaching the screen for raster
+        widgets; the remaining delay until the next vertical refresh cannot be seen.
+
+        The first onset after `start_trial` is kept as the onset of that trial. Every
+        onset latency (from `expect` to the frame being flushed) is counted in a
+        histogram of whole milliseconds.
+
+        Args:
+            widget (QWidget): The widget to watch.
+            clock (Clock): Clock from which to take times.
+
+        """
+        super(FrameMonitor, self).__init__()
+        self.widget = widget
+        self.clock = clock
+        self.histogram = Counter()
+        self.requested_ns = None
+        self.trial_onset_ns = None
+        self.trial_latency_ms = None
+        self._started = False
+        self._scheduled = False
+        widget.installEventFilter(self)
+        if widget.window() is not widget:
+            widget.window().installEventFilter(self)
+
+    def expect(self) -> None:
+        """Note that something has been displayed and should be in the next frame."""
+        if self.requested_ns is None:
+            self.requested_ns = self.clock.now_ns()
+
+    def start_trial(self) -> None:
+        """Forget the last trial's onset and expect a new frame."""
+        self.trial_onset_ns = None
+        self.trial_latency_ms = None
+        self._started = True
+        self.expect()
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        """Overridden from `QObject`. Never consumes the event."""
+        if self.requested_ns is not None and not self._scheduled:
+            if event.type() in (QEvent.Paint, QEvent.UpdateRequest):
+                self._scheduled = True
+                QTimer.singleShot(0, self._presented)
+        return False
+
+    def _presented(self) -> None:
+        """Record the onset of the frame just flushed."""
+        onset = self.clock.now_ns()
+        latency = (onset - self.requested_ns) / 1e6
+        self.histogram[int(latency)] += 1
+        instant("frame presented", latency_ms=latency)
+        if self._started:
+            self.trial_onset_ns = onset
+            self.trial_latency_ms = latency
+            self._started = False
+        self.requested_ns = None
+        self._scheduled = False
+
+
+def get_clock() -> Clock:
+    """Returns the clock shared by the whole app."""
+    global _clock
+    if _clock is None:
+        _clock = Clock()
+    return _clock
@@ -0,0 +1,162 @@
+"""Defines optional tracing of where time goes while the app runs.
+
+"""
+from atexit import register
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from json import dumps
+from logging import getLogger
+from os import environ, getpid
+from threading import Lock, get_ident
+from typing import Callable, ContextManager, Union
+
+logger = getLogger(__name__)
+_tracer = None
+_null = nullcontext()
+
+
+class Tracer(object):
+    def __init__(self, path: str) -> None:
+        """Writes spans to a trace file.
+
+        The file uses the JSON array form of the Chrome trace event format, so it can
+        be opened in Perfetto (ui.perfetto.dev) or chrome://tracing. Each span is
+        written as a complete ("X") event as soon as it ends, and instants (such as a
+        frame being presented) as "i" events. The closing bracket of the array is
+        optional in this format, so a trace cut short by a crash can still be opened.
+        Times are taken from the app's clock, in microseconds.
+
+        Args:
+            path (str): Path to the trace file.
+
+        """
+        logger.debug("initialised %s with path=%s", type(self), path)
+        self.path = path
+        self._clock = None
+        self._pid = getpid()
+        self._lock = Lock()
+        self._file = open(path, "w", buffering=1024 * 1024)
+        self._file.write("[")
+        self._separator = "\n"
+        register(self.close)
+
+    def now_ns(self) -> int:
+        """Returns the current time from the app's clock.
+
+        The clock is looked up on first use rather than when the tracer is created,
+        because the tracer is created while `timing` (which imports this module) is
+        still being imported.
+
+        """
+        if self._clock is None:
+            from .timing import get_clock
+
+            self._clock = get_clock()
+        return self._clock.now_ns()
+
+    def _write(self, event: dict) -> None:
+        event.update(pid=self._pid, tid=get_ident())
+        line = dumps(event, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(self._separator + line)
+                self._separator = ",\n"
+
+    @contextmanager
+    def span(self, name: str, cat: str = "charlie2", **args) -> ContextManager:
+        """Record how long the body of a `with` block takes."""
+        t0 = self.now_ns()
+        try:
+            yield
+        finally:
+            t1 = self.now_ns()
+            event = {"name": name, "cat": cat, "ph": "X", "ts": t0 / 1e3}
+            event["dur"] = (t1 - t0) / 1e3
+            if args:
+                event["args"] = args
+            self._write(event)
+
+    def instant(self, name: str, cat: str = "charlie2", **args) -> None:
+        """Record a moment in time."""
+        event = {"name": name, "cat": cat, "ph": "i", "s": "t"}
+        event["ts"] = self.now_ns() / 1e3
+        if args:
+            event["args"] = args
+        self._write(event)
+
+    def flush(self) -> None:
+        """Write buffered events to the file."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self) -> None:
+        """Finish the trace file. Called automatically at exit."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.write("\n]\n")
+                self._file.close()
+
+
+def start_tracing(path: str) -> Tracer:
+    """Start tracing to `path`.
+
+    Only functions decorated with `traced` after this is called are traced, so it
+    must be called before the rest of the app is imported. This happens automatically
+    if the `CHARLIE2_TRACE` environment variable is set to a path.
+
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path)
+    return _tracer
+
+
+def get_tracer() -> Union[Tracer, None]:
+    """Returns the tracer, or None if tracing is off."""
+    return _tracer
+
+
+def traced(name: str = None, cat: str = "charlie2") -> Callable:
+    """Decorator which records a span each time the decorated function is called.
+
+    If tracing is off when the function is defined, the function is returned
+    unchanged, so tracing costs nothing at all unless it is turned on.
+
+    Args:
+        name (:obj:`str`, optional): Name of the span. Defaults to the qualified name
+            of the function.
+        cat (:obj:`str`, optional): Category of the span.
+
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if _tracer is None:
+            return func
+        label = func.__qualname__ if name is None else name
+
+        @wraps(func)
+        def wrapper(*args, **kwds):
+            with _tracer.span(label, cat):
+                return func(*args, **kwds)
+
+        return wrapper
+
+    return decorator
+
+
+def span(name: str, cat: str = "charlie2", **args) -> ContextManager:
+    """Context manager which records a span if tracing is on."""
+    if _tracer is None:
+        return _null
+    return _tracer.span(name, cat, **args)
+
+
+def instant(name: str, cat: str = "charlie2", **args) -> None:
+    """Record a moment in time if tracing is on."""
+    if _tracer is not None:
+        _tracer.instant(name, cat, **args)
+
+
+if environ.get("CHARLIE2_TRACE"):
+    start_tracing(environ["CHARLIE2_TRACE"])
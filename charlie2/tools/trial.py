@@ -19,7 +19,7 @@ class Trial(dict):
 
         """
         super(Trial, self).__init__(*args, **kwds)
-        logger.debug(f"initialised {type(self)}")
+        logger.debug("initialised %s", type(self))
 
         self.__dict__ = self
         defaults = {
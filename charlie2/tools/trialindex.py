@@ -0,0 +1,69 @@
+"""Defines secondary indexes over completed trials.
+
+"""
+from collections import deque
+from logging import getLogger
+from typing import Iterable, List, Sequence
+
+logger = getLogger(__name__)
+
+
+class TrialIndex(object):
+    def __init__(
+        self,
+        keys: Iterable[Sequence[str]] = (),
+        window: int = 0,
+        trials: Iterable[dict] = (),
+    ) -> None:
+        """Secondary indexes over completed trials.
+
+        Stopping rules typically need the completed trials from the current block, or
+        with the same value of some other key (e.g., `length`), or just the last few
+        trials. Filtering `completed_trials` to find these on every trial means the
+        work done between trials grows with the length of the test. Instead, a trial
+        index is updated by `add` as each trial is completed, so these lookups take
+        constant time.
+
+        Trials are always indexed by `block_number`. Additional indexes are declared as
+        tuples of keys; trials are grouped by their values of all keys in the tuple.
+        The last `window` trials are kept in `window`.
+
+        Indexes are not stored with the procedure; they are rebuilt from the completed
+        trials when it is loaded.
+
+        Args:
+            keys (:obj:`iterable` of :obj:`tuple`, optional): Additional indexes.
+            window (:obj:`int`, optional): Number of most recent trials to keep.
+            trials (:obj:`iterable` of :obj:`dict`, optional): Trials already completed.
+
+        """
+        self.keys = [("block_number",)] + [tuple(k) for k in keys]
+        self.indexes = {k: {} for k in self.keys}
+        self.window = deque(maxlen=window)
+        for trial in trials:
+            self.add(trial)
+
+    def add(self, trial: dict) -> None:
+        """Add a completed trial to every index."""
+        for keys, index in self.indexes.items():
+            value = tuple(trial.get(k) for k in keys)
+            index.setdefault(value, []).append(trial)
+        self.window.append(trial)
+
+    def lookup(self, keys: Sequence[str], values: Sequence) -> List[dict]:
+        """Returns the completed trials with the given values of `keys`.
+
+        Args:
+            keys (:obj:`sequence` of :obj:`str`): Keys of a declared index.
+            values (:obj:`sequence`): Values of those keys, in the same order.
+
+        Returns:
+            :obj:`list` of :obj:`dict`: Matching trials, in order of completion. This
+                list is owned by the index and must not be modified.
+
+        """
+        return self.indexes[tuple(keys)].get(tuple(values), [])
+
+    def block(self, b: int) -> List[dict]:
+        """Returns the completed trials in block `b`."""
+        return self.lookup(("block_number",), (b,))
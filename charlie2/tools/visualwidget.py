@@ -2,15 +2,23 @@
 
 """
 from copy import copy
+from functools import partial
 from logging import getLogger
-from typing import List, Tuple
+from typing import Callable, List, Tuple, Union
 
-from PyQt5.QtCore import QPoint, QRect, Qt
-from PyQt5.QtGui import QFont, QKeyEvent, QPixmap
+from PyQt5.QtCore import QObject, QPoint, QRect, Qt
+from PyQt5.QtGui import QFont, QKeyEvent, QPaintEvent, QPen, QPixmap
 from PyQt5.QtWidgets import QLabel, QPushButton, QWidget
 
+from .atlas import get_vis_stim_atlases
 from .audiowidget import AudioWidget
+from .compositor import Compositor, Line
 from .paths import get_instructions, get_vis_stim_paths
+from .pixmapcache import get_pixmap_cache
+from .prefetch import get_prefetcher
+from .scheduler import Timeline
+from .timing import FrameMonitor, get_clock
+from .tracing import traced
 
 logger = getLogger(__name__)
 
@@ -24,10 +32,11 @@ class VisualWidget(AudioWidget):
 
         """
         super(VisualWidget, self).__init__(parent)
-        logger.debug(f"initialised {type(self)} with parent={parent}")
+        logger.debug("initialised %s with parent=%s", type(self), parent)
 
         # stimuli paths
         self.vis_stim_paths = get_vis_stim_paths(self.kwds["test_name"])
+        self.vis_stim_atlases = get_vis_stim_atlases(self.kwds["test_name"])
 
         # font widget
         self.instructions_font = QFont("Helvetica", 26)
@@ -40,13 +49,30 @@ class VisualWidget(AudioWidget):
         # zones
         self.zones = []
 
+        # draw images and text with a compositor instead of labels; override this
+        self.compositing = False
+        self.compositor = Compositor(self)
+
+        # measures when stimuli reach the screen
+        self.frames = FrameMonitor(self, get_clock())
+
+        # timelines still running, and whether each belongs to the current trial
+        self._timelines = []
+
+        # pool of reusable widgets
+        self._pool = {QLabel: [], QPushButton: []}
+        self.pool_stats = {"created": 0, "reused": 0, "released": 0}
+
+    @traced()
     def clear_screen(self, delete: bool = False) -> None:
         """Hide widgets.
 
-        Hides and optionally deletes all children of this widget.
+        Hides and optionally deletes all children of this widget and all items drawn by
+        the compositor. Labels and buttons from the widget pool are returned to the pool
+        instead of being deleted.
 
         Args:
-            delete (:obj:`bool`, optional): Delete the widgets as well.
+            delete (:obj:`bool`, optional): Delete (or release) the widgets as well.
 
         """
         # for widgets  organized in a layout
@@ -58,7 +84,7 @@ class VisualWidget(AudioWidget):
                 if widget is not None:
                     widget.hide()
                     if delete:
-                        widget.deleteLater()
+                        self._delete(widget)
                 else:
                     self.clearLayout(item.layout())
         # for widgets not organized
@@ -66,8 +92,88 @@ class VisualWidget(AudioWidget):
             if hasattr(widget, "hide"):
                 widget.hide()
             if delete:
-                widget.deleteLater()
+                self._delete(widget)
+        # for items drawn by the compositor
+        if delete:
+            self.compositor.clear()
+        else:
+            self.compositor.hide_all()
+
+    def _delete(self, widget: QObject) -> None:
+        """Release a pooled widget, or delete any other object."""
+        if widget.property("pooled"):
+            self.release(widget)
+        else:
+            widget.deleteLater()
+
+    def acquire(self, cls: type = QLabel) -> Union[QLabel, QPushButton]:
+        """Return a hidden label or button from the widget pool.
+
+        Trials typically show a few labels and then throw them away. Creating and
+        deleting these every trial is slow and leaves a backlog of deferred deletions
+        during long blocks, so instead widgets are taken from a pool and returned to it
+        by `release` (or `clear_screen(delete=True)`). A new widget is only created if
+        the pool is empty. Widgets come back in the same state as a new one: no text or
+        pixmap, the inherited font, default alignment and geometry, enabled, and with no
+        connected signals.
+
+        Args:
+            cls (:obj:`type`, optional): `QLabel` or `QPushButton`.
+
+        Returns:
+            widget (:obj:`QLabel` or :obj:`QPushButton`): The widget.
+
+        """
+        free = self._pool[cls]
+        if free:
+            widget = free.pop()
+            self.pool_stats["reused"] += 1
+        else:
+            widget = cls(self)
+            widget.setProperty("pooled", True)
+            self.pool_stats["created"] += 1
+        widget.setProperty("free", False)
+        return widget
+
+    def release(self, *widgets: Union[QLabel, QPushButton]) -> None:
+        """Reset widgets from the pool, hide them, and return them to the pool.
+
+        Widgets must not be used after being released. Widgets which did not come from
+        the pool are deleted instead.
 
+        Args:
+            *widgets (:obj:`QLabel` or :obj:`QPushButton`): Widgets to release.
+
+        """
+        for widget in widgets:
+            if not widget.property("pooled"):
+                widget.deleteLater()
+                continue
+            if widget.property("free"):
+                continue
+            widget.hide()
+            if isinstance(widget, QPushButton):
+                try:
+                    widget.clicked.disconnect()
+                except TypeError:
+                    pass  # nothing was connected
+                widget.setText("")
+                cls = QPushButton
+            else:
+                widget.clear()
+                widget.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)
+                cls = QLabel
+            if widget.testAttribute(Qt.WA_SetFont):
+                # a font with no attributes set clears the explicit font, so the
+                # widget inherits its parent's font again
+                widget.setFont(QFont())
+            widget.setEnabled(True)
+            widget.setGeometry(0, 0, 100, 30)
+            widget.setProperty("free", True)
+            self._pool[cls].append(widget)
+            self.pool_stats["released"] += 1
+
+    @traced()
     def display_instructions(self, message: str, font: QFont = None) -> QLabel:
         """Display instructions.
 
@@ -83,10 +189,11 @@ class VisualWidget(AudioWidget):
 
         """
         logger.debug(
-            f"called display_instructions() with message={message} and font={font}"
+            "called display_instructions() with message=%s and font=%s", message, font
         )
         self.clear_screen()
-        label = QLabel(message, self)
+        label = self.acquire()
+        label.setText(message)
         label.setAlignment(Qt.AlignCenter)
         if font is None:
             label.setFont(self.instructions_font)
@@ -109,7 +216,7 @@ class VisualWidget(AudioWidget):
             message (str): Message to display.
             font (:obj:`QFont`, optional): A font in which to display the instructions.
             wait (:obj:`bool`, optional): Wait for a bit before enabling the continue
-                button.
+                button. This does not block; the method returns immediately.
 
         Returns:
             label (QLabel): Object containing the message.
@@ -117,24 +224,16 @@ class VisualWidget(AudioWidget):
 
         """
         logger.debug(
-            f"called display_instructions_with_continue_button() with message={message}"
-            f"and font={font}"
+            "called display_instructions_with_continue_button() with message=%s and "
+            "font=%s",
+            message,
+            font,
         )
         label = self.display_instructions(message, font)
         button = self._display_continue_button()
         logger.debug("now waiting for continue button to be pressed")
         if wait:
-            if hasattr(self, "paintEvent"):
-                logger.debug("temporarily disabling paint events")
-                _paintEvent = copy(self.paintEvent)
-                self.paintEvent = lambda _: None
-            button.setEnabled(False)
-            if self.debugging is False:
-                self.sleep(2 * 1000)
-            button.setEnabled(True)
-            if hasattr(self, "paintEvent"):
-                logger.debug("reenabling paint events")
-                self.paintEvent = _paintEvent
+            self._enable_after_wait(button)
         return label, button
 
     def display_instructions_with_space_bar(self, message: str) -> QLabel:
@@ -148,7 +247,7 @@ class VisualWidget(AudioWidget):
 
         """
         logger.debug(
-            f"called display_instructions_with_space_bar() with message={message}"
+            "called display_instructions_with_space_bar() with message=%s", message
         )
         label = self.display_instructions(message)
         logger.debug("now waiting for space bar to be pressed")
@@ -156,24 +255,53 @@ class VisualWidget(AudioWidget):
         self.keyReleaseEvent = self._space_bar_continue
         label.setFocus()
         logger.debug("what widget needs to be in focus for this to work?")
-        logger.debug("self? %s" % self.hasFocus())
-        logger.debug("label? %s" % label.hasFocus())
+        logger.debug("self? %s", self.hasFocus())
+        logger.debug("label? %s", label.hasFocus())
         return label
 
     def _space_bar_continue(self, event: QKeyEvent) -> None:
-        logger.debug(f"called _space_bar_continue() with event={event}")
-        logger.debug("%s pressed, looking for %s" % (event.key(), Qt.Key_Space))
+        logger.debug("called _space_bar_continue() with event=%s", event)
+        logger.debug("%s pressed, looking for %s", event.key(), Qt.Key_Space)
         if event.key() == Qt.Key_Space:
             logger.debug("got the correct key")
             self._trial()
             self.keyReleaseEvent = self._keyReleaseEvent
 
+    @traced()
+    def load_pixmap(self, s: str) -> QPixmap:
+        """Return the pixmap for an image.
+
+        Pixmaps are taken from the shared pixmap cache, so each image is only decoded
+        once. If the image is not cached yet, it is taken from the test's atlas if one
+        has been built (see `charlie2.tools.atlas`), or else from the prefetcher if it
+        has already decoded the image, and converted to a pixmap.
+
+        Args:
+            s (str): Name of the .png image file.
+
+        Returns:
+            pixmap (QPixmap): The image.
+
+        """
+
+        def decode(path: str) -> Union[None, QPixmap]:
+            if s in self.vis_stim_atlases:
+                image = self.vis_stim_atlases[s].image(s)
+            else:
+                image = get_prefetcher().take(path)
+            return None if image is None else QPixmap.fromImage(image)
+
+        return get_pixmap_cache().get(self.vis_stim_paths[s], decode=decode)
+
+    @traced()
     def load_image(self, s: str) -> QLabel:
         """Return an image.
 
         It is possibly important for correct alignment to explicitly set the size of the
         label after setting its pixmap since it does not inherit this attribute even
-        though the entire pixmap may br visible.
+        though the entire pixmap may br visible. The label is taken from the widget
+        pool, so `release` it when it is no longer needed. If `compositing` is True, a
+        compositor sprite is returned instead of a label.
 
         Args:
             s (str): Path to the .png image file.
@@ -182,9 +310,9 @@ class VisualWidget(AudioWidget):
             label (QLabel): Label containing the image as a pixmap.
 
         """
-        logger.debug(f"called load_image() with s={s}")
-        label = QLabel(self)
-        pixmap = QPixmap(self.vis_stim_paths[s])
+        logger.debug("called load_image() with s=%s", s)
+        label = self.compositor.sprite() if self.compositing else self.acquire()
+        pixmap = self.load_pixmap(s)
         label.setPixmap(pixmap)
         label.resize(pixmap.size())
         label.hide()
@@ -204,7 +332,7 @@ class VisualWidget(AudioWidget):
             g (QRect): Updated geometry of the wdiget.
 
         """
-        logger.debug(f"called move_widget() with widget={widget} and pos={pos}")
+        logger.debug("called move_widget() with widget=%s and pos=%s", widget, pos)
         x = self.frameGeometry().center().x() + pos[0]
         y = self.frameGeometry().center().y() - pos[1]
         point = QPoint(x, y)
@@ -213,6 +341,7 @@ class VisualWidget(AudioWidget):
         widget.move(g.topLeft())
         return g
 
+    @traced()
     def display_image(self, s: object, pos: object = None) -> QLabel:
         """Show an image on the screen.
 
@@ -224,7 +353,7 @@ class VisualWidget(AudioWidget):
             label (QLabel): Label containing the image as a pixmap.
 
         """
-        logger.debug(f"called display_image() with s={s} and pos={pos}")
+        logger.debug("called display_image() with s=%s and pos=%s", s, pos)
         if isinstance(s, str):
             label = self.load_image(s)
         else:
@@ -232,12 +361,17 @@ class VisualWidget(AudioWidget):
         if pos:
             self.move_widget(label, pos)
         label.show()
-        logger.debug("showing %s" % s)
+        self.frames.expect()
+        logger.debug("showing %s", s)
         return label
 
+    @traced()
     def load_text(self, s: str) -> QLabel:
         """Return a QLabel containing text.
 
+        The label is taken from the widget pool, so `release` it when it is no longer
+        needed. If `compositing` is True, a compositor sprite is returned instead.
+
         Args:
             s (str): Text.
 
@@ -245,14 +379,16 @@ class VisualWidget(AudioWidget):
             label (QLabel): Label containing the text.
 
         """
-        logger.debug(f"called load_text() with s={s}")
-        label = QLabel(s, self)
+        logger.debug("called load_text() with s=%s", s)
+        label = self.compositor.sprite() if self.compositing else self.acquire()
+        label.setText(s)
         label.setFont(self.instructions_font)
         label.setAlignment(Qt.AlignCenter)
         label.resize(label.sizeHint())
         label.hide()
         return label
 
+    @traced()
     def display_text(self, s: str, pos: object = None) -> QLabel:
         """Same as `load_text` but also display it.
 
@@ -264,7 +400,7 @@ class VisualWidget(AudioWidget):
             label (QLabel): Label containing the text.
 
         """
-        logger.debug(f"called display_text() with s={s} and pos={pos}")
+        logger.debug("called display_text() with s=%s and pos=%s", s, pos)
         if isinstance(s, str):
             label = self.load_text(s)
         else:
@@ -272,8 +408,42 @@ class VisualWidget(AudioWidget):
         if pos:
             self.move_widget(label, pos)
         label.show()
+        self.frames.expect()
         return label
 
+    @traced()
+    def display_line(self, a: QPoint, b: QPoint, pen: QPen = None) -> Line:
+        """Draw a line with the compositor.
+
+        Args:
+            a (QPoint): Start of the line.
+            b (QPoint): End of the line.
+            pen (:obj:`QPen`, optional): Pen with which to draw the line. Defaults to a
+                4-pixel black line.
+
+        Returns:
+            line (Line): The line, which can be hidden or deleted like a sprite.
+
+        """
+        logger.debug("called display_line() with a=%s and b=%s", a, b)
+        line = self.compositor.line(a, b, pen)
+        line.show()
+        return line
+
+    @traced()
+    def paintEvent(self, event: QPaintEvent) -> None:
+        """Overridden from `QWidget`. Draws the items in the compositor's display list.
+
+        Tests which override this method and also use the compositor should call
+        `self.compositor.paint(event)`.
+
+        Args:
+            event (PyQt5.QtGui.QPaintEvent)
+
+        """
+        if self.compositor.items:
+            self.compositor.paint(event)
+
     def load_keyboard_arrow_keys(
         self, instructions: List[str], y: int = -225
     ) -> List[QLabel]:
@@ -290,8 +460,9 @@ class VisualWidget(AudioWidget):
 
         """
         logger.debug(
-            f"called load_keyboard_arrow_keys() with instructions={instructions} and "
-            f"y={y}"
+            "called load_keyboard_arrow_keys() with instructions=%s and y=%s",
+            instructions,
+            y,
         )
         w = []
         lx = -75
@@ -322,6 +493,7 @@ class VisualWidget(AudioWidget):
                 w.append(a)
         return w
 
+    @traced()
     def display_keyboard_arrow_keys(
         self, instructions: List[str], y: int = -225
     ) -> List[QLabel]:
@@ -338,8 +510,9 @@ class VisualWidget(AudioWidget):
 
         """
         logger.debug(
-            f"called display_keyboard_arrow_keys() with instructions={instructions} and"
-            f" y={y}"
+            "called display_keyboard_arrow_keys() with instructions=%s and y=%s",
+            instructions,
+            y,
         )
         widgets = self.load_keyboard_arrow_keys(instructions, y)
         [w.show() for w in widgets]
@@ -365,7 +538,8 @@ class VisualWidget(AudioWidget):
     def _display_continue_button(self) -> QPushButton:
         """Display a continue button."""
         logger.debug("called _display_continue_button()")
-        button = QPushButton(self.instructions[1], self)
+        button = self.acquire(QPushButton)
+        button.setText(self.instructions[1])
         button.setFont(self.instructions_font)
         size = (button.sizeHint().width() + 20, button.sizeHint().height() + 20)
         button.resize(*size)
@@ -382,31 +556,91 @@ class VisualWidget(AudioWidget):
         button = self._display_continue_button()
         button.clicked.disconnect()
         if wait:
-            if hasattr(self, "paintEvent"):
-                logger.debug("temporarily disabling paint events")
-                _paintEvent = copy(self.paintEvent)
-                self.paintEvent = lambda _: None
-            button.setEnabled(False)
-            if self.debugging is False:
-                self.sleep(2 * 1000)
+            self._enable_after_wait(button)
+        button.clicked.connect(self._next_trial)
+
+    def _enable_after_wait(self, button: QPushButton) -> None:
+        """Disable `button` and paint events for 2 s, without blocking."""
+        if "paintEvent" not in self.__dict__:
+            logger.debug("temporarily disabling paint events")
+            self.paintEvent = lambda _: None
+        button.setEnabled(False)
+
+        def enable() -> None:
             button.setEnabled(True)
-            if hasattr(self, "paintEvent"):
+            if self.__dict__.pop("paintEvent", None) is not None:
                 logger.debug("reenabling paint events")
-                self.paintEvent = _paintEvent
-        button.clicked.connect(self._next_trial)
+
+        ms = 0 if self.debugging else 2 * 1000
+        self.timeline("continue button").then(None, ms, "wait").then(enable).start()
 
     def _continue_button_pressed(self) -> None:
         """Continue to next trial."""
         logger.debug("called _continue_button_pressed()")
         self._trial()
 
-    def display_countdown(self, t: int = 5, s: int = 1000) -> None:
-        """Display the countdown timer."""
+    def display_countdown(
+        self, t: int = 5, s: int = 1000, then: Callable = None
+    ) -> Timeline:
+        """Display the countdown timer.
+
+        This does not block; the method returns immediately and the countdown runs from
+        the event loop.
+
+        Args:
+            t (:obj:`int`, optional): Number to count down from.
+            s (:obj:`int`, optional): Duration of each number in ms.
+            then (:obj:`callable`, optional): Called when the countdown is over.
+
+        Returns:
+            timeline (Timeline): The running countdown.
+
+        """
         logger.debug("called display_countdown()")
         if self.debugging is True:
             s = 10
+        timeline = self.timeline("countdown")
         for i in range(t):
-            self.display_instructions(self.instructions[0] % (t - i))
-            if self.debugging is False:
-                self.pip.play()
-            self.sleep(s)
+            timeline.then(partial(self._countdown_step, t - i), s, str(t - i))
+        return timeline.then(then, 0, "over").start()
+
+    def _countdown_step(self, i: int) -> None:
+        """Display one number of the countdown."""
+        self.display_instructions(self.instructions[0] % i)
+        if self.debugging is False:
+            self.pip.play()
+
+    def timeline(self, name: str = "timeline", trial: bool = False) -> Timeline:
+        """Return a new timeline.
+
+        Use timelines rather than pausing (see `charlie2.tools.scheduler.Timeline`).
+        The widget keeps a reference to each timeline until it has finished, and all
+        timelines are cancelled when the test is closed.
+
+        Args:
+            name (:obj:`str`, optional): Name used when logging.
+            trial (:obj:`bool`, optional): The timeline belongs to the current trial,
+                so cancel it if the test moves on to another trial (e.g., because of a
+                timeout) before it has finished.
+
+        Returns:
+            timeline (Timeline): The new timeline, which has not been started.
+
+        """
+        timeline = Timeline(name, self.frames.clock)
+        self._timelines = [x for x in self._timelines if x[0].running]
+        self._timelines.append((timeline, trial))
+        return timeline
+
+    def cancel_timelines(self, trial_only: bool = False) -> None:
+        """Cancel running timelines.
+
+        Args:
+            trial_only (:obj:`bool`, optional): Only cancel timelines which belong to
+                the current trial.
+
+        """
+        for timeline, trial in self._timelines:
+            if trial or not trial_only:
+                timeline.cancel()
+        self._timelines = [x for x in self._timelines if x[0].running]
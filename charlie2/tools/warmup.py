@@ -0,0 +1,91 @@
+"""Defines a preparer which warms up the next test of a batch in the background.
+
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import getLogger
+from time import perf_counter
+from typing import Callable
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from .atlas import get_vis_stim_atlases
+from .paths import get_aud_stim_paths, get_instructions, get_test, get_vis_stim_paths
+
+logger = getLogger(__name__)
+
+
+def warm(test_name: str, language: str) -> float:
+    """Do the parts of setting up a test which do not need the GUI thread.
+
+    Imports the test and instructions modules, lists the stimuli, and opens the
+    stimulus atlases, so that these are already done (and cached) by the time the
+    test widget is created.
+
+    Args:
+        test_name (str): Name of the test.
+        language (str): Language of the instructions.
+
+    Returns:
+        float: Time taken, in ms.
+
+    """
+    t0 = perf_counter()
+    get_test(test_name)
+    get_instructions(test_name, language)
+    get_vis_stim_paths(test_name)
+    get_aud_stim_paths(test_name)
+    get_vis_stim_atlases(test_name)
+    return (perf_counter() - t0) * 1000
+
+
+class TestPreparer(QObject):
+
+    ready = pyqtSignal(str)
+    built = pyqtSignal(str)
+
+    def __init__(self) -> None:
+        """Test preparer.
+
+        In a batch, setting up the next test only once the previous one has closed
+        means the proband waits while modules are imported, stimuli are listed, and
+        the procedure is loaded. Instead, the main window asks the preparer to warm up
+        the next test while the final block of the current one runs. `warm` runs on a
+        background thread, and `ready` is then emitted on the GUI thread (signals
+        emitted from other threads are queued), where the main window creates the
+        widget. Creating a widget is quick, but loading its procedure and generating
+        its trials can take much longer, so the main window hands that back to the
+        preparer with `build`, and `built` is emitted once it has finished. Only then
+        is the procedure attached to the widget, on the GUI thread.
+
+        """
+        super(TestPreparer, self).__init__()
+        logger.debug("initialised %s", type(self))
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="warmup")
+
+    def prepare(self, test_name: str, language: str) -> None:
+        """Start warming up a test in the background."""
+        logger.debug("warming up %s", test_name)
+        future = self._executor.submit(warm, test_name, language)
+        future.add_done_callback(lambda f: self._done(test_name, f))
+
+    def build(self, test_name: str, func: Callable) -> Future:
+        """Call `func` in the background, then emit `built`.
+
+        Returns:
+            Future: The future of the call, whose result is the return value of
+                `func`.
+
+        """
+        logger.debug("building %s", test_name)
+        future = self._executor.submit(func)
+        future.add_done_callback(lambda f: self.built.emit(test_name))
+        return future
+
+    def _done(self, test_name: str, future: Future) -> None:
+        try:
+            logger.debug("warmed up %s in %.1f ms", test_name, future.result())
+        except Exception as e:
+            # the test will be set up from scratch when it starts
+            logger.warning("could not warm up %s: %s", test_name, e)
+            return
+        self.ready.emit(test_name)
@@ -1,13 +1,9 @@
-import logging
+import charlie2.tools.startup  # noqa: F401 (imported first, to start the clock)
 from charlie2.tools.app import run_app
+from charlie2.tools.logs import setup_logging
 
 
 if __name__ == "__main__":
 
-    logging.basicConfig(
-        filename="charlie.log",
-        filemode="w",
-        level=logging.DEBUG,
-        format="%(asctime)s::%(name)s::%(levelname)s::%(message)s",
-    )
+    setup_logging("charlie.log")
     run_app()